@@ -0,0 +1,17 @@
+""" the bindings the benchmarks use, importable so the registry can
+    pickle them
+"""
+from binding import Binding
+from binding_test.models import Product
+
+
+class ProductBinding(Binding):
+    model = Product
+
+
+class LocalProductBinding(ProductBinding):
+    local_cache = True
+
+
+class OrderedProductBinding(ProductBinding):
+    ordered = True
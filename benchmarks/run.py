@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+""" benchmarks for the binding hot paths
+
+    python benchmarks/run.py                      # against a local redis
+    python benchmarks/run.py --fake               # in-process fakeredis
+    python benchmarks/run.py --sizes 1000,10000 --compare old.json
+
+each scenario reports ops/s, latency percentiles per call and redis round
+trips per operation. results are saved as json named after the current
+commit so runs can be compared between commits
+"""
+from __future__ import print_function
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def configure(options):
+    import django
+    from django.conf import settings
+
+    cache_options = {
+        "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        "COMPRESSOR": "django_redis.compressors.zlib.ZlibCompressor",
+    }
+    if options.fake:
+        import fakeredis
+        # FakeConnection is the name before fakeredis 2.27
+        cache_options["CONNECTION_POOL_KWARGS"] = {
+            "connection_class": getattr(
+                fakeredis, "FakeRedisConnection", None) or
+            fakeredis.FakeConnection,
+        }
+
+    settings.configure(
+        DEBUG=False,
+        USE_TZ=True,
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': ':memory:',
+            }
+        },
+        INSTALLED_APPS=(
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'binding',
+            'binding_test',
+            'django_redis',
+        ),
+        CACHES={
+            "default": {
+                "BACKEND": "django_redis.cache.RedisCache",
+                "LOCATION": options.redis,
+                "OPTIONS": cache_options,
+            }
+        },
+    )
+    django.setup()
+
+    from django.core.management import call_command
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+class RoundTrips(object):
+    """ counts the commands and pipelines sent to redis """
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self):
+        from django.core.cache import cache
+
+        pool = cache.client.get_client().connection_pool
+        connection_class = pool.connection_class
+        send = connection_class.send_packed_command
+
+        def send_packed_command(connection, *args, **kwargs):
+            self.count += 1
+            return send(connection, *args, **kwargs)
+        connection_class.send_packed_command = send_packed_command
+
+
+def percentile(values, percent):
+    """ nearest rank percentile of sorted values """
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class Suite(object):
+
+    def __init__(self, options):
+        self.options = options
+        self.results = []
+        self.round_trips = RoundTrips()
+        self.round_trips.install()
+
+    def measure(self, name, function, repeat, ops=1, setup=None):
+        """ times `repeat` calls of `function`, each doing `ops` operations """
+        latencies = []
+        trips = 0
+        for x in range(repeat):
+            if setup:
+                setup()
+            before = self.round_trips.count
+            start = time.perf_counter()
+            function()
+            latencies.append(time.perf_counter() - start)
+            trips += self.round_trips.count - before
+
+        latencies.sort()
+        result = dict(
+            name=name,
+            calls=repeat,
+            ops=ops * repeat,
+            ops_per_second=ops * repeat / sum(latencies),
+            p50_ms=percentile(latencies, 50) * 1000,
+            p95_ms=percentile(latencies, 95) * 1000,
+            p99_ms=percentile(latencies, 99) * 1000,
+            round_trips_per_op=trips / float(ops * repeat),
+        )
+        self.results.append(result)
+        print(
+            "{name:<28} {ops_per_second:>12.1f} ops/s  p50 {p50_ms:>9.3f}ms  "
+            "p95 {p95_ms:>9.3f}ms  p99 {p99_ms:>9.3f}ms  "
+            "{round_trips_per_op:>8.2f} trips/op".format(**result)
+        )
+        return result
+
+    def repeat_for(self, size):
+        return max(3, min(50, 200000 // size))
+
+    # fixtures
+    def reset(self):
+        from django.core.cache import cache
+        from django.db import connection
+        from binding import listeners
+        from binding_test.models import Product
+
+        cache.clear()
+        listeners._bindings.clear()
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {}".format(Product._meta.db_table))
+
+    def populate(self, count):
+        """ products written without a binding listening """
+        from django.db.models import QuerySet
+        from binding_test.models import Product
+
+        QuerySet(Product).bulk_create([
+            Product(name="product {}".format(x),
+                    venue="store" if x % 2 else "website")
+            for x in range(count)
+        ], batch_size=5000)
+        return list(Product.objects.all())
+
+    def make_binding(self, kind="ProductBinding", name=None):
+        import bindings
+        return getattr(bindings, kind)(name=name)
+
+    # scenarios
+    def single_save(self):
+        self.reset()
+        products = self.populate(1000)
+        self.make_binding()
+        products = iter(products * 2)
+
+        def save():
+            product = next(products)
+            product.name = "saved"
+            product.save()
+        self.measure("save/single", save, 500)
+
+    def bulk_save(self):
+        self.reset()
+        products = self.populate(1000)
+        binding = self.make_binding()
+        self.measure(
+            "save/bulk-1000", lambda: binding.models_saved(products), 10,
+            ops=len(products))
+
+    def read_all(self):
+        for size in self.options.sizes:
+            self.reset()
+            self.populate(size)
+            binding = self.make_binding()
+            self.measure("all/{}".format(size), binding.all,
+                         self.repeat_for(size))
+            local = self.make_binding("LocalProductBinding", "local")
+            self.measure("all-local/{}".format(size), local.all,
+                         self.repeat_for(size))
+
+    def refresh(self):
+        for size in self.options.sizes:
+            self.reset()
+            self.populate(size)
+            binding = self.make_binding()
+            self.measure("refresh/{}".format(size), binding.refresh, 3)
+
+    def send_sync(self):
+        from binding import tasks
+
+        sent = []
+        send_message = tasks.send_message
+        # the transport isn't part of what's measured
+        tasks.send_message = lambda binding, packet, group=None: sent.append(
+            packet)
+        try:
+            for size in self.options.sizes:
+                if size > 10000:
+                    continue
+                self.reset()
+                self.populate(size)
+                binding = self.make_binding("OrderedProductBinding")
+                pages = size // 100 + 1
+
+                def sync():
+                    for page in range(1, pages + 1):
+                        tasks.send_sync(binding, group="bench", page=page)
+                self.measure("send_sync/{}".format(size), sync, 3, ops=pages)
+        finally:
+            tasks.send_message = send_message
+
+    def dispatch(self):
+        for count in (1, 10, 50):
+            self.reset()
+            products = self.populate(100)
+            for x in range(count):
+                self.make_binding(name="binding-{}".format(x))
+            products = iter(products * 2)
+
+            def save():
+                product = next(products)
+                product.name = "dispatched"
+                product.save()
+            self.measure("dispatch/{}-bindings".format(count), save, 100)
+
+    def drf(self):
+        from rest_framework import serializers
+        from rest_framework.test import APIRequestFactory
+        from binding.drf import BoundModelViewSet
+        from binding_test.models import Product
+
+        class ProductSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Product
+                fields = ("id", "name", "venue")
+
+        class ProductViewSet(BoundModelViewSet):
+            model = Product
+            serializer_class = ProductSerializer
+
+        self.reset()
+        products = self.populate(1000)
+        ProductViewSet.binding = self.make_binding()
+        factory = APIRequestFactory()
+        list_view = ProductViewSet.as_view({"get": "list"})
+        detail_view = ProductViewSet.as_view({"get": "retrieve"})
+
+        def get_list():
+            list_view(factory.get("/products/")).render()
+
+        def get_detail():
+            detail_view(
+                factory.get("/products/1/"), pk=products[0].pk).render()
+        self.measure("drf/list-1000", get_list, 20)
+        self.measure("drf/retrieve", get_detail, 200)
+
+    scenarios = (
+        "single_save", "bulk_save", "read_all", "refresh",
+        "send_sync", "dispatch", "drf",
+    )
+
+    def run(self):
+        from django.db.models.signals import post_delete, post_save
+        from binding.listeners import model_deleted, model_saved
+        from binding_test.models import Product
+
+        post_save.connect(model_saved, sender=Product)
+        post_delete.connect(model_deleted, sender=Product)
+        for scenario in self.scenarios:
+            if self.options.only and scenario not in self.options.only:
+                continue
+            getattr(self, scenario)()
+        self.reset()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+        ).decode("utf8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, path):
+    with open(path) as f:
+        previous = dict((r["name"], r) for r in json.load(f)["results"])
+    print("\ncompared to {}:".format(path))
+    for result in results:
+        old = previous.get(result["name"])
+        if not old:
+            continue
+        print("{:<28} {:>+8.1f}% ops/s  {:>+8.2f} trips/op".format(
+            result["name"],
+            (result["ops_per_second"] / old["ops_per_second"] - 1) * 100,
+            result["round_trips_per_op"] - old["round_trips_per_op"],
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--redis", default="redis://localhost:6379/11",
+                        help="redis url, the database is flushed")
+    parser.add_argument("--fake", action="store_true",
+                        help="use an in-process fakeredis server")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--only", nargs="*", choices=Suite.scenarios)
+    parser.add_argument("--output", help="json results file")
+    parser.add_argument("--compare", help="earlier json results to compare")
+    options = parser.parse_args()
+
+    configure(options)
+    suite = Suite(options)
+    suite.run()
+
+    revision = git_revision()
+    output = options.output or os.path.join(
+        ROOT, "benchmarks", "results", "{}.json".format(revision))
+    if not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, "w") as f:
+        json.dump(dict(
+            revision=revision,
+            date=datetime.datetime.now().isoformat(),
+            python=platform.python_version(),
+            redis="fakeredis" if options.fake else options.redis,
+            sizes=options.sizes,
+            results=suite.results,
+        ), f, indent=2)
+    print("\nsaved", output)
+
+    if options.compare:
+        compare(suite.results, options.compare)
+
+
+if __name__ == "__main__":
+    main()
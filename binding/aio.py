@@ -0,0 +1,314 @@
+""" asyncio counterparts of the binding reads and writes, for async views
+    and consumers. they use redis.asyncio with the same keys and encoding
+    as the django-redis client, so both sides can be mixed freely
+"""
+import asyncio
+import weakref
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from redis.exceptions import WatchError
+
+from .binding import HashCacheDict, chunked
+
+# clients are bound to the loop they were created in
+_connections = weakref.WeakKeyDictionary()
+
+
+def connection_options(config):
+    """ the url and client kwargs of a django-redis cache's settings """
+    location = config["LOCATION"]
+    if not isinstance(location, str):
+        # the first server is the primary
+        location = location[0]
+    options = config.get("OPTIONS", {})
+    # ssl and pool settings are passed on as they are to django-redis
+    kwargs = dict(options.get("CONNECTION_POOL_KWARGS", {}))
+    if options.get("PASSWORD"):
+        kwargs["password"] = options["PASSWORD"]
+    if "SOCKET_TIMEOUT" in options:
+        kwargs["socket_timeout"] = options["SOCKET_TIMEOUT"]
+    if "SOCKET_CONNECT_TIMEOUT" in options:
+        kwargs["socket_connect_timeout"] = options["SOCKET_CONNECT_TIMEOUT"]
+    return location, kwargs
+
+
+def get_connection(cache_name="default"):
+    """ an asyncio redis client for a django-redis cache, one per loop """
+    from redis import asyncio as aioredis
+
+    connections = _connections.setdefault(asyncio.get_running_loop(), {})
+    if cache_name not in connections:
+        config = settings.CACHES[cache_name]
+        location, kwargs = connection_options(config)
+        sentinels = config.get("OPTIONS", {}).get("SENTINELS")
+        if sentinels:
+            # the location names the service, as with django-redis'
+            # SentinelConnectionFactory
+            from redis.asyncio.sentinel import Sentinel
+            url = urlparse(location)
+            kwargs.setdefault("db", int(url.path.strip("/") or 0))
+            sentinel = Sentinel(
+                sentinels,
+                sentinel_kwargs=config["OPTIONS"].get("SENTINEL_KWARGS"),
+                **kwargs)
+            connections[cache_name] = sentinel.master_for(url.hostname)
+        else:
+            connections[cache_name] = aioredis.from_url(location, **kwargs)
+    return connections[cache_name]
+
+
+class AsyncCache(object):
+    """ the asyncio side of a CacheDict """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    @property
+    def con(self):
+        return get_connection(self.cache.cache_name)
+
+    def pipeline(self, transaction=True):
+        return self.con.pipeline(transaction=transaction)
+
+    def script(self, source):
+        return self.con.register_script(source)
+
+    async def transaction(self, queue, watch=(), read=None):
+        """ CacheBase.transaction, `read` is awaited """
+        async with self.con.pipeline() as pipe:
+            while True:
+                try:
+                    if watch:
+                        await pipe.watch(*watch)
+                    values = (await read(pipe)) if read else None
+                    pipe.multi()
+                    queue(pipe, values)
+                    return await pipe.execute()
+                except WatchError:
+                    continue
+
+    async def get(self, name, default=None):
+        value = await self.con.get(self.cache.make_key(name))
+        return default if value is None else self.cache.decode(value)
+
+    async def get_many_raw(self, keys):
+        if isinstance(self.cache, HashCacheDict):
+            return await self._get_many_hashed(keys)
+        keys = [str(key) for key in keys]
+        if not keys:
+            return {}
+        pipe = self.con.pipeline(transaction=False)
+        for chunk in chunked(keys, 1000):
+            pipe.mget([self.cache.make_key(key) for key in chunk])
+        values = [value for chunk in await pipe.execute() for value in chunk]
+        return dict(
+            (key, value) for key, value in zip(keys, values)
+            if value is not None
+        )
+
+    async def _get_many_hashed(self, keys):
+        buckets = self.cache.by_bucket(keys)
+        if not buckets:
+            return {}
+        pipe = self.con.pipeline(transaction=False)
+        for bucket, names in buckets.items():
+            pipe.hmget(bucket, names)
+        retval = {}
+        for names, values in zip(buckets.values(), await pipe.execute()):
+            retval.update(
+                (name, value) for name, value in zip(names, values)
+                if value is not None
+            )
+        return retval
+
+    async def get_many(self, keys):
+        return dict(
+            (key, self.cache.decode(value))
+            for key, value in (await self.get_many_raw(keys)).items()
+        )
+
+    async def get_all(self, keys):
+        """ CacheDict.get_all, dense buckets read whole with HSCAN """
+        if not isinstance(self.cache, HashCacheDict):
+            return await self.get_many(keys)
+        wanted = set(str(key) for key in keys)
+        dense, sparse = self.cache.split_dense(wanted)
+        retval = await self.get_many(sparse)
+        pending = [(bucket, 0) for bucket in dense]
+        while pending:
+            pipe = self.con.pipeline(transaction=False)
+            for bucket, cursor in pending:
+                pipe.hscan(bucket, cursor, count=1000)
+            cursors = []
+            for (bucket, _), (cursor, values) in zip(
+                    pending, await pipe.execute()):
+                for name, value in values.items():
+                    name = name.decode("utf-8")
+                    if name in wanted:
+                        retval[name] = self.cache.decode(value)
+                if cursor:
+                    cursors.append((bucket, cursor))
+            pending = cursors
+        return retval
+
+    async def members(self, keys):
+        """ the members of the sets at the full redis `keys`, a
+            MemberSet's shards, walked with SSCAN when there are several,
+            their cursors advanced together
+        """
+        if len(keys) == 1:
+            return await self.con.smembers(keys[0])
+        members = set()
+        pending = [(key, 0) for key in keys]
+        while pending:
+            pipe = self.con.pipeline(transaction=False)
+            for key, cursor in pending:
+                pipe.sscan(key, cursor, count=1000)
+            cursors = []
+            for (key, _), (cursor, found) in zip(
+                    pending, await pipe.execute()):
+                members.update(found)
+                if cursor:
+                    cursors.append((key, cursor))
+            pending = cursors
+        return members
+
+    async def members_length(self, keys):
+        pipe = self.con.pipeline(transaction=False)
+        for key in keys:
+            pipe.scard(key)
+        return sum(await pipe.execute())
+
+
+class AsyncBindingMixin(object):
+    """ adds awaitable reads and atomic writes to a binding:
+
+        class ProductBinding(AsyncBindingMixin, Binding):
+            model = Product
+
+        objects = await binding.aall()
+        version = await binding.aversion
+
+        database reads, the changelog and messages still run synchronously
+        in a worker thread
+    """
+
+    @property
+    def ameta_cache(self):
+        return AsyncCache(self.meta_cache)
+
+    @property
+    def aobject_cache(self):
+        return AsyncCache(self.object_cache)
+
+    @property
+    def aversion(self):
+        return self._aversion()
+
+    async def _aversion(self):
+        if not self._version:
+            self._version = await self.acurrent_version()
+        return self._version
+
+    async def acurrent_version(self):
+        return await self.ameta_cache.get("version")
+
+    async def alast_modified(self):
+        return await self.ameta_cache.get("last-modified")
+
+    async def ametadata(self):
+        values = await self.ameta_cache.get_many(["version", "last-modified"])
+        return values.get("version"), values.get("last-modified")
+
+    async def akeys(self):
+        return await self.ameta_cache.members(self.member_set.keys) or []
+
+    async def acount(self):
+        return await self.ameta_cache.members_length(self.member_set.keys)
+
+    async def aall(self):
+        version = None
+        if self.local_cache:
+            version = await self.ametadata()
+            qs = self.local_objects.get(self.local_key, version)
+            if qs is not None:
+                return dict(qs)
+
+        keys = await self.akeys()
+        if not keys:
+            # filled from the database
+            return await sync_to_async(self.all)()
+        qs = await self.aobject_cache.get_all(
+            [k.decode("utf8") for k in keys])
+        if version is not None:
+            self.local_objects.set(self.local_key, version, qs)
+            return dict(qs)
+        return qs
+
+    async def aall_raw(self):
+        keys = await self.akeys()
+        if not keys:
+            await self.aall()
+            keys = await self.akeys()
+        return await self.aobject_cache.get_many_raw(
+            [k.decode("utf8") for k in keys])
+
+    async def _aindexed_values(self, keys, pipe):
+        """ _indexed_values on a pipeline watching the indexes """
+        if not self.indexes:
+            return None
+        indexed = {}
+        for field in self.indexes:
+            indexed[field] = await pipe.hmget(
+                self.meta_cache.get_key(self.get_index_key(field)), keys)
+        return indexed
+
+    async def _aindexed_transaction(self, keys, queue):
+        return await self.ameta_cache.transaction(
+            queue, self.get_index_keys(),
+            lambda pipe: self._aindexed_values(keys, pipe))
+
+    async def abump(self, changes=None):
+        pipe = self.ameta_cache.pipeline()
+        self._queue_bump(pipe, changes)
+        version = (await pipe.execute())[-1]
+        self._version = None
+        if self.changelog_size:
+            await sync_to_async(self.log_changes)(version, changes)
+        return version
+
+    async def asave_instance(self, instance, created):
+        """ save_instance, always written atomically """
+        key = self.get_instance_key(instance)
+        serialized = self.serialize_object(instance)
+        version = (await self._aindexed_transaction(
+            [key], lambda pipe, indexed: self.queue_save(
+                pipe, key, serialized, indexed=indexed)))[-1]
+        await sync_to_async(self.saved)(version, key, serialized, created)
+        return version
+
+    async def adelete_instance(self, instance):
+        """ delete_instance, always written atomically """
+        key = self.get_instance_key(instance)
+        shard = self.member_set.get_shard_key(key)
+
+        async def read(pipe):
+            if not await pipe.sismember(shard, key):
+                return None
+            return await self._aindexed_values([key], pipe) or {}
+
+        results = await self.ameta_cache.transaction(
+            lambda pipe, indexed: self.queue_delete(pipe, key, indexed),
+            [shard] + self.get_index_keys(), read)
+        self._version = None
+        if not results:
+            return None
+        version = results[-1]
+
+        def deleted():
+            self.log_changes(version, [key])
+            self.message("delete", instance)
+        await sync_to_async(deleted)()
+        return version
@@ -5,4 +5,8 @@ class BindingAppConfig(apps.AppConfig):
     name = "binding"
 
     def ready(self):
-        from . import listeners
+        from django.conf import settings
+        from . import listeners, metrics
+
+        if getattr(settings, "BINDING_METRICS", False):
+            metrics.enable(getattr(settings, "BINDING_METRICS_INTERVAL", None))
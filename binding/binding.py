@@ -1,68 +1,287 @@
 from __future__ import print_function
 
 import logging
+import re
+import threading
 import time
 import traceback
+import uuid
+import zlib
+import calendar
+import datetime
+from collections import OrderedDict
+from numbers import Number
+
 import six
 
 from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django_redis import get_redis_connection
+from redis.exceptions import WatchError
+
+from . import metrics
+from .codecs import get_codec, instance_to_dict
+from .lookups import Unsupported, compile_predicate, signature
 
 debug = logging.getLogger("debug")
 
+# sets the last modified time, bumps the version and scores the changed
+# keys (the rest of ARGV) with the new version in the changelog
+BUMP_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1])
+local version = redis.call('INCR', KEYS[2])
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[3], version, ARGV[i])
+end
+return version
+"""
+
+
+def chunked(iterable, size):
+    """ yields lists of up to `size` items """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_instances(model, values, field="pk", chunk_size=1000):
+    """ the instances among `values`, with the other values looked up by
+        `field` a chunk at a time. returns the instances and the values
+        no row has
+    """
+    objects = []
+    lookups = []
+    for value in values:
+        if isinstance(value, model):
+            objects.append(value)
+        else:
+            lookups.append(value)
+
+    missing = []
+    for chunk in chunked(lookups, chunk_size):
+        found = list(model._default_manager.filter(**{field + "__in": chunk}))
+        found_keys = set(str(getattr(o, field)) for o in found)
+        objects.extend(found)
+        missing.extend(value for value in chunk if str(value) not in found_keys)
+    return objects, missing
+
+
+def escape_glob(value):
+    """ `value` matched literally by a redis glob pattern, as in SCAN MATCH """
+    return re.sub(r"([\\*?\[\]])", r"\\\1", value)
+
+
+def parse_temporal(value):
+    """ the datetime or date of an iso string, otherwise None """
+    try:
+        return parse_datetime(value) or parse_date(value)
+    except ValueError:
+        return None
+
+
+def natural_score(key):
+    """ page order score of a key: numeric keys by value, ahead of the
+        others, which share +inf and so sort as strings
+    """
+    return float(key) if key.isdigit() else float("inf")
+
 
 class CacheBase(object):
 
-    def __init__(self, prefix, cache_name="default", timeout=None):
+    def __init__(self, prefix, cache_name="default", timeout=None, codec=None):
         self.con = get_redis_connection(cache_name)
+        self.cache_name = cache_name
         self.prefix = prefix
         self.cache = caches[cache_name]
         self.timeout = timeout
+        self.codec = get_codec(codec)
+        self.scripts = {}
 
     def get_key(self, name):
         return "{}:{}".format(self.prefix, name)
 
+    def make_key(self, name):
+        """ the full redis key the django cache uses for `name` """
+        return self.cache.client.make_key(self.get_key(name))
+
+    def make_pattern(self, p="*"):
+        """ a SCAN MATCH pattern for the names matching the glob `p`,
+            the prefix itself matched literally
+        """
+        return escape_glob(self.make_key("")) + p
+
+    def encode(self, value):
+        if self.codec:
+            return self.codec.encode(value)
+        return self.cache.client.encode(value)
+
+    def decode(self, value):
+        if self.codec:
+            return self.codec.decode(value)
+        return self.cache.client.decode(value)
+
+    def pipeline(self, transaction=True):
+        return self.con.pipeline(transaction=transaction)
+
+    def script(self, source):
+        if source not in self.scripts:
+            self.scripts[source] = self.con.register_script(source)
+        return self.scripts[source]
+
+    def transaction(self, queue, watch=(), read=None):
+        """ executes what `queue(pipe, values)` queues in a MULTI, `values`
+            being what `read(pipe)` returned while watching the full redis
+            keys in `watch`. starts over when another client changes them
+            meanwhile
+        """
+        with self.pipeline() as pipe:
+            while True:
+                try:
+                    if watch:
+                        pipe.watch(*watch)
+                    values = read(pipe) if read else None
+                    pipe.multi()
+                    queue(pipe, values)
+                    return pipe.execute()
+                except WatchError:
+                    continue
+
     def strip_key(self, key):
         return key[len(self.prefix):]
 
+    def unlink(self, keys, chunk_size=1000):
+        """ unlinks full redis keys a chunk at a time, redis frees them
+            in the background
+        """
+        removed = 0
+        for chunk in chunked(keys, chunk_size):
+            removed += self.con.unlink(*chunk)
+        return removed
+
+    def retire(self, keys, footprints=(), chunk_size=1000):
+        """ unlinks full redis `keys` first, so readers stop seeing them,
+            then the keys listed in the `footprints` sets and the sets.
+            returns how many keys were removed
+        """
+        removed = self.unlink(keys, chunk_size)
+        for footprint in footprints:
+            removed += self.unlink(
+                self.con.sscan_iter(footprint, count=chunk_size), chunk_size)
+            removed += self.con.unlink(footprint)
+        return removed
+
+    @metrics.instrument("cache.get")
     def get(self, name, default=None):
+        if self.codec:
+            value = self.con.get(self.make_key(name))
+            return default if value is None else self.decode(value)
         return self.cache.get(self.get_key(name), default)
 
+    @metrics.instrument("cache.set")
     def set(self, name, value, timeout=None):
+        if self.codec:
+            pipe = self.pipeline(transaction=False)
+            self.queue_set(pipe, name, value, timeout)
+            pipe.execute()
+            return
         self.cache.set(self.get_key(name), value, timeout or self.timeout)
 
+    def queue_set(self, pipe, name, value, timeout=None):
+        """ same as set, but queued on a pipeline """
+        timeout = timeout or self.timeout
+        pipe.set(
+            self.make_key(name), self.encode(value),
+            px=int(timeout * 1000) if timeout else None)
+
 
 class CacheDict(CacheBase):
 
+    @metrics.instrument("cache.get_many")
     def get_many(self, keys, default=None):
-        many = self.cache.get_many([
-            self.get_key(key) for key in keys
-        ])
-        retval = {}
-        for key, value in many.items():
-            retval[key.rsplit(":")[-1]] = value
-        return retval
+        return dict(
+            (key, self.decode(value))
+            for key, value in self.get_many_raw(keys).items()
+        )
+
+    @metrics.instrument("cache.get_many_raw")
+    def get_many_raw(self, keys, chunk_size=1000):
+        """ the stored bytes for each key, without decoding them. an MGET
+            per chunk_size keys, pipelined in one round trip
+        """
+        keys = [str(key) for key in keys]
+        if not keys:
+            return {}
+        pipe = self.pipeline(transaction=False)
+        for chunk in chunked(keys, chunk_size):
+            pipe.mget([self.make_key(key) for key in chunk])
+        values = [value for chunk in pipe.execute() for value in chunk]
+        return dict(
+            (key, value) for key, value in zip(keys, values)
+            if value is not None
+        )
 
-    def set_many(self, objects, timeout=None):
-        sending = {}
-        for key, value in objects.items():
-            sending[self.get_key(key)] = value
-        self.cache.set_many(sending, timeout)
+    @metrics.instrument("cache.set_many")
+    def set_many(self, objects, timeout=None, chunk_size=1000):
+        """ writes `chunk_size` objects per round trip """
+        for chunk in chunked(objects.items(), chunk_size):
+            if self.codec:
+                pipe = self.pipeline(transaction=False)
+                for key, value in chunk:
+                    self.queue_set(pipe, key, value, timeout)
+                pipe.execute()
+            else:
+                self.cache.set_many(dict(
+                    (self.get_key(key), value) for key, value in chunk
+                ), timeout)
 
     def incr(self, name, amount=1):
-        self.cache.incr(self.get_key(name), 1, self.timeout)
+        return self.cache.incr(self.get_key(name), amount)
 
     def expire(self, name, timeout=0):
         self.cache.expire(self.get_key(name), timeout)
 
-    def clear(self):
-        self.cache.delete_pattern(self.get_key("*"))
+    def get_all(self, names):
+        """ the values of a binding's members, see HashCacheDict """
+        return self.get_many(names)
+
+    def storage_keys(self, names):
+        """ the full redis keys holding the values of `names` """
+        return [self.make_key(name) for name in names]
+
+    def delete_many(self, names, chunk_size=1000):
+        return self.unlink(self.storage_keys(names), chunk_size)
+
+    def clear(self, chunk_size=1000):
+        """ unlinks the cached names with SCAN, a chunk at a time """
+        return self.unlink(
+            self.con.scan_iter(match=self.make_pattern(), count=chunk_size),
+            chunk_size)
+
+    def scan_keys(self, p="*", count=1000):
+        """ yields the names matching the glob `p`, using SCAN so redis
+            is never blocked the way KEYS blocks it
+        """
+        start = len(self.make_key(""))
+        for key in self.con.scan_iter(match=self.make_pattern(p), count=count):
+            yield key.decode("utf-8")[start:]
+
+    def iter_pattern(self, p="*", chunk_size=1000):
+        """ yields the values of the names matching the glob `p`,
+            fetched `chunk_size` at a time
+        """
+        for names in chunked(self.scan_keys(p, chunk_size), chunk_size):
+            for value in self.get_many(names).values():
+                yield value
 
     def pattern(self, p):
-        p = self.get_key(p)
-        keys = self.cache.keys(p)
-        return self.cache.get_many(keys).values()
+        return list(self.iter_pattern(p))
 
     def set_add(self, key, *value):
         key = self.get_key(key)
@@ -73,70 +292,667 @@ class CacheDict(CacheBase):
             self.con.persist(key)
         return retval
 
-    def set_remove(self, key, value):
-        return self.con.srem(self.get_key(key), value)
+    def queue_set_add(self, pipe, key, *value):
+        """ same as set_add, but queued on a pipeline """
+        key = self.get_key(key)
+        pipe.sadd(key, *value)
+        if self.timeout:
+            pipe.expire(key, self.timeout)
+        else:
+            pipe.persist(key)
+
+    def set_remove(self, key, *value):
+        return self.con.srem(self.get_key(key), *value)
 
     def set_exists(self, key, value):
         return self.con.sismember(self.get_key(key), value)
 
+    def set_contains(self, key, values, chunk_size=1000):
+        """ the subset of `values` that are members, checking `chunk_size`
+            of them per round trip
+        """
+        key = self.get_key(key)
+        members = []
+        for chunk in chunked(values, chunk_size):
+            pipe = self.pipeline(transaction=False)
+            for value in chunk:
+                pipe.sismember(key, value)
+            members.extend(
+                value for value, exists in zip(chunk, pipe.execute()) if exists)
+        return members
+
     def set_length(self, key):
         return self.con.scard(self.get_key(key))
 
+    @metrics.instrument("cache.set_all")
     def set_all(self, key):
         return self.con.smembers(self.get_key(key))
 
     def set_clear(self, key):
         return self.con.delete(self.get_key(key))
 
+    def sorted_add(self, key, mapping):
+        pipe = self.pipeline(transaction=False)
+        self.queue_sorted_add(pipe, key, mapping)
+        return pipe.execute()[0]
+
+    def queue_sorted_add(self, pipe, key, mapping):
+        """ same as sorted_add, but queued on a pipeline """
+        key = self.get_key(key)
+        pipe.zadd(key, mapping)
+        if self.timeout:
+            pipe.expire(key, self.timeout)
+        else:
+            pipe.persist(key)
+
+    def sorted_remove(self, key, *value):
+        return self.con.zrem(self.get_key(key), *value)
+
+    def sorted_range(self, key, start, stop, withscores=False):
+        return self.con.zrange(
+            self.get_key(key), start, stop, withscores=withscores)
+
+    def sorted_rank(self, key, value):
+        return self.con.zrank(self.get_key(key), value)
+
+    def sorted_score(self, key, value):
+        return self.con.zscore(self.get_key(key), value)
+
+    def sorted_range_by_score(self, key, low, high):
+        return self.con.zrangebyscore(self.get_key(key), low, high)
+
+    def sorted_scan(self, key, count=1000):
+        """ the members of a sorted set with ZSCAN, in no particular order.
+            a member may be yielded twice if the set grows meanwhile
+        """
+        for member, score in self.con.zscan_iter(self.get_key(key), count=count):
+            yield member
+
+    def sorted_trim(self, key, start, stop):
+        return self.con.zremrangebyrank(self.get_key(key), start, stop)
+
+    def sorted_length(self, key):
+        return self.con.zcard(self.get_key(key))
+
+
+class HashCacheDict(CacheDict):
+    """ a CacheDict keeping its values as fields of redis hashes, a bucket
+        per `bucket_size` numeric keys (other keys are spread over
+        `buckets` hashes). small hashes are stored as listpacks, far more
+        compact than a key per value as long as the values fit redis'
+        hash-max-listpack-value. timeouts apply to whole buckets, counted
+        from the write that found the bucket without one
+    """
+
+    def __init__(self, prefix, cache_name="default", timeout=None, codec=None,
+                 bucket_size=100, buckets=1024):
+        super(HashCacheDict, self).__init__(prefix, cache_name, timeout, codec)
+        self.bucket_size = bucket_size
+        self.buckets = buckets
+
+    def get_bucket_key(self, name):
+        name = str(name)
+        if name.isdigit():
+            bucket = int(name) // self.bucket_size
+        else:
+            bucket = "h{}".format(
+                (zlib.crc32(name.encode("utf8")) & 0xffffffff) % self.buckets)
+        return self.get_key("b:{}".format(bucket))
+
+    def by_bucket(self, names):
+        buckets = OrderedDict()
+        for name in names:
+            buckets.setdefault(self.get_bucket_key(name), []).append(str(name))
+        return buckets
+
+    @metrics.instrument("cache.get")
+    def get(self, name, default=None):
+        value = self.con.hget(self.get_bucket_key(name), str(name))
+        return default if value is None else self.decode(value)
+
+    @metrics.instrument("cache.set")
+    def set(self, name, value, timeout=None):
+        pipe = self.pipeline(transaction=False)
+        self.queue_set(pipe, name, value, timeout)
+        pipe.execute()
+
+    def queue_set(self, pipe, name, value, timeout=None):
+        self.queue_set_many(pipe, {name: value}, timeout)
+
+    def queue_set_many(self, pipe, objects, timeout=None):
+        timeout = timeout or self.timeout
+        for bucket, names in self.by_bucket(objects.keys()).items():
+            pipe.hset(bucket, mapping=dict(
+                (name, self.encode(objects[name])) for name in names))
+            if timeout:
+                # later writes don't push the bucket's expiry back
+                pipe.expire(bucket, int(timeout), nx=True)
+
+    @metrics.instrument("cache.set_many")
+    def set_many(self, objects, timeout=None, chunk_size=1000):
+        for chunk in chunked(objects.items(), chunk_size):
+            pipe = self.pipeline(transaction=False)
+            self.queue_set_many(pipe, dict(
+                (str(key), value) for key, value in chunk), timeout)
+            pipe.execute()
+
+    @metrics.instrument("cache.get_many")
+    def get_many(self, keys, default=None):
+        return dict(
+            (key, self.decode(value))
+            for key, value in self.get_many_raw(keys).items()
+        )
+
+    @metrics.instrument("cache.get_many_raw")
+    def get_many_raw(self, keys):
+        """ the stored bytes for each key, an HMGET per bucket in one
+            round trip
+        """
+        buckets = self.by_bucket(keys)
+        if not buckets:
+            return {}
+        pipe = self.pipeline(transaction=False)
+        for bucket, names in buckets.items():
+            pipe.hmget(bucket, names)
+        retval = {}
+        for names, values in zip(buckets.values(), pipe.execute()):
+            retval.update(
+                (name, value) for name, value in zip(names, values)
+                if value is not None
+            )
+        return retval
+
+    def expire(self, name, timeout=0):
+        """ drops `name` right away, or expires its whole bucket """
+        if timeout:
+            self.con.expire(self.get_bucket_key(name), int(timeout))
+        else:
+            self.con.hdel(self.get_bucket_key(name), str(name))
+
+    @metrics.instrument("cache.get_all")
+    def split_dense(self, names):
+        """ the buckets holding at least half a bucket of `names`, cheaper
+            read whole, and the names in the other buckets
+        """
+        dense, sparse = [], []
+        for bucket, fields in self.by_bucket(names).items():
+            if len(fields) * 2 >= self.bucket_size:
+                dense.append(bucket)
+            else:
+                sparse.extend(fields)
+        return dense, sparse
+
+    def get_all(self, names, count=1000):
+        """ get_many for a binding's members. buckets mostly holding
+            `names` are read whole with HSCAN rather than naming every
+            field, the names that weren't asked for are dropped. a sparse
+            binding's names are read with HMGET, its buckets are mostly
+            other bindings' objects
+        """
+        wanted = set(str(name) for name in names)
+        dense, sparse = self.split_dense(wanted)
+        retval = self.get_many(sparse)
+        pending = [(bucket, 0) for bucket in dense]
+        while pending:
+            cursors = []
+            for chunk in chunked(pending, count):
+                pipe = self.pipeline(transaction=False)
+                for bucket, cursor in chunk:
+                    pipe.hscan(bucket, cursor, count=count)
+                for (bucket, _), (cursor, values) in zip(chunk, pipe.execute()):
+                    for name, value in values.items():
+                        name = name.decode("utf-8")
+                        if name in wanted:
+                            retval[name] = self.decode(value)
+                    if cursor:
+                        cursors.append((bucket, cursor))
+            pending = cursors
+        return retval
+
+    def delete_many(self, names, chunk_size=1000):
+        """ removes the fields of `names` from their buckets """
+        for chunk in chunked(names, chunk_size):
+            pipe = self.pipeline(transaction=False)
+            for bucket, fields in self.by_bucket(chunk).items():
+                pipe.hdel(bucket, *fields)
+            pipe.execute()
+
+    def storage_keys(self, names):
+        """ the buckets holding `names`, along with the other names
+            sharing them
+        """
+        return list(self.by_bucket(names).keys())
+
+    def scan_buckets(self, count=1000):
+        return self.con.scan_iter(
+            match=escape_glob(self.get_key("b:")) + "*", count=count)
+
+    def scan_items(self, p="*", count=1000):
+        """ yields (name, stored bytes) for the names matching the glob
+            `p`, with HSCAN over every bucket
+        """
+        for bucket in self.scan_buckets(count):
+            for name, value in self.con.hscan_iter(bucket, match=p, count=count):
+                yield name.decode("utf-8"), value
+
+    def scan_keys(self, p="*", count=1000):
+        for name, value in self.scan_items(p, count):
+            yield name
+
+    def iter_pattern(self, p="*", chunk_size=1000):
+        for name, value in self.scan_items(p, chunk_size):
+            yield self.decode(value)
+
+    def clear(self, chunk_size=1000):
+        return self.unlink(self.scan_buckets(chunk_size), chunk_size)
+
+
+class MemberSet(object):
+    """ a binding's member keys, in a single redis set or hashed over
+        `shards` sets so no one command walks all of them. the shards live
+        next to the rest of the binding's metadata, sharding bounds the
+        work per command, it doesn't spread a binding over cluster nodes.
+        each shard count has its own keys, see Binding.reshard
+    """
+
+    def __init__(self, cache, name="objects", shards=1, chunk_size=1000):
+        self.cache = cache
+        self.shards = shards
+        self.chunk_size = chunk_size
+        if shards > 1:
+            self.keys = [
+                "{}:{}:{}".format(cache.get_key(name), shards, shard)
+                for shard in range(shards)
+            ]
+        else:
+            self.keys = [cache.get_key(name)]
+
+    def get_shard_key(self, key):
+        if self.shards == 1:
+            return self.keys[0]
+        shard = zlib.crc32(str(key).encode("utf8")) & 0xffffffff
+        return self.keys[shard % self.shards]
+
+    def by_shard(self, keys):
+        shards = OrderedDict()
+        for key in keys:
+            shards.setdefault(self.get_shard_key(key), []).append(key)
+        return shards
+
+    def _execute(self, command, keys):
+        """ runs `command` once per shard holding some of `keys`, a round
+            trip per chunk_size keys, and sums the results
+        """
+        total = 0
+        for chunk in chunked(keys, self.chunk_size):
+            pipe = self.cache.pipeline(transaction=False)
+            for shard, members in self.by_shard(chunk).items():
+                getattr(pipe, command)(shard, *members)
+            total += sum(pipe.execute())
+        return total
+
+    def queue_add(self, pipe, *keys):
+        for shard, members in self.by_shard(keys).items():
+            pipe.sadd(shard, *members)
+            if self.cache.timeout:
+                pipe.expire(shard, self.cache.timeout)
+            else:
+                pipe.persist(shard)
+
+    def add(self, *keys):
+        """ adds keys, returns how many weren't members """
+        added = 0
+        for chunk in chunked(keys, self.chunk_size):
+            pipe = self.cache.pipeline(transaction=False)
+            self.queue_add(pipe, *chunk)
+            # every sadd is followed by an expire or persist
+            added += sum(pipe.execute()[::2])
+        return added
+
+    def queue_remove(self, pipe, *keys):
+        for shard, members in self.by_shard(keys).items():
+            pipe.srem(shard, *members)
+
+    def remove(self, *keys):
+        if not keys:
+            return 0
+        return self._execute("srem", keys)
+
+    def exists(self, key):
+        return self.cache.con.sismember(self.get_shard_key(key), key)
+
+    def contains(self, keys):
+        """ the subset of `keys` that are members, a round trip per
+            chunk_size keys
+        """
+        members = []
+        for chunk in chunked(keys, self.chunk_size):
+            pipe = self.cache.pipeline(transaction=False)
+            for key in chunk:
+                pipe.sismember(self.get_shard_key(key), key)
+            members.extend(
+                key for key, exists in zip(chunk, pipe.execute()) if exists)
+        return members
+
+    def iter(self, count=1000):
+        """ yields every member, the shards' SSCAN cursors advanced
+            together in one round trip per step
+        """
+        pending = [(shard, 0) for shard in self.keys]
+        while pending:
+            pipe = self.cache.pipeline(transaction=False)
+            for shard, cursor in pending:
+                pipe.sscan(shard, cursor, count=count)
+            cursors = []
+            for (shard, _), (cursor, members) in zip(pending, pipe.execute()):
+                for member in members:
+                    yield member
+                if cursor:
+                    cursors.append((shard, cursor))
+            pending = cursors
+
+    @metrics.instrument("cache.members_all")
+    def all(self):
+        """ every member, sharded sets are walked with SSCAN so no
+            single command returns all of them
+        """
+        if self.shards == 1:
+            return self.cache.con.smembers(self.keys[0])
+        return set(self.iter())
+
+    def length(self):
+        if self.shards == 1:
+            return self.cache.con.scard(self.keys[0])
+        pipe = self.cache.pipeline(transaction=False)
+        for shard in self.keys:
+            pipe.scard(shard)
+        return sum(pipe.execute())
+
 
 class CacheArray(CacheBase):
+    """ keyed values with their keys kept in a sorted set, all scored 0,
+        so keys sharing a prefix are a single lexicographic range
+    """
 
-    def __init__(self, prefix, cache_name="default", timeout=None):
+    def __init__(self, prefix, cache_name="default", timeout=None,
+                 chunk_size=1000):
         super(CacheArray, self).__init__(prefix, cache_name, timeout)
-        self.array_key = self.get_key("set")
+        self.array_key = self.get_key("index")
+        self.generation_key = self.get_key("generation")
+        self.chunk_size = chunk_size
+        self.migrated = False
+
+    def migrate(self):
+        """ moves the keys of the set older releases kept into the index,
+            once per process. the set is removed once they're all in
+        """
+        if self.migrated:
+            return
+        legacy = self.get_key("set")
+        for keys in chunked(
+                self.con.sscan_iter(legacy, count=self.chunk_size),
+                self.chunk_size):
+            self.con.zadd(self.array_key, dict((key, 0) for key in keys))
+        self.con.unlink(legacy)
+        self.migrated = True
+
+    def queue_touch(self, pipe):
+        # kept without a timeout, readers cache for as long as it lasts
+        pipe.set(self.generation_key, uuid.uuid4().hex)
+
+    def touch(self):
+        """ marks the array as changed so process-local copies are dropped """
+        self.queue_touch(self.con)
+
+    def generation(self):
+        """ changes whenever the array does. a generation lost to eviction
+            is replaced, so process-local copies can be kept again
+        """
+        generation = self.con.get(self.generation_key)
+        if generation is None:
+            self.con.set(self.generation_key, uuid.uuid4().hex, nx=True)
+            generation = self.con.get(self.generation_key)
+        return generation
 
     def add(self, key, value, timeout=None):
-        key = self.get_key(key)
-        self.con.sadd(self.array_key, key)
-        self.cache.set(key, value, timeout=timeout or self.timeout)
+        key = "{}".format(key)
+        self.migrate()
+        pipe = self.pipeline()
+        pipe.zadd(self.array_key, {self.get_key(key): 0})
+        self.queue_set(pipe, key, value, timeout)
+        self.queue_touch(pipe)
+        pipe.execute()
 
     def remove(self, key):
-        key = self.get_key(key)
-        self.con.srem(self.array_key, key)
-        self.cache.delete(key)
-
+        key = "{}".format(key)
+        self.migrate()
+        pipe = self.pipeline()
+        pipe.zrem(self.array_key, self.get_key(key))
+        pipe.delete(self.make_key(key))
+        self.queue_touch(pipe)
+        pipe.execute()
+
+    def keys(self, prefix=""):
+        """ the full keys starting with `prefix`, from the index """
+        self.migrate()
+        if not prefix:
+            members = self.con.zrange(self.array_key, 0, -1)
+        else:
+            low = self.get_key(prefix).encode("utf-8")
+            members = self.con.zrangebylex(
+                self.array_key, b"[" + low, b"[" + low + b"\xff")
+        return [m.decode("utf-8") for m in members]
+
+    def iter_keys(self, prefix=""):
+        """ yields the full keys starting with `prefix`, reading the index
+            chunk_size keys at a time
+        """
+        self.migrate()
+        low = self.get_key(prefix).encode("utf-8")
+        high = b"[" + low + b"\xff"
+        low = b"[" + low
+        while True:
+            members = self.con.zrangebylex(
+                self.array_key, low, high, start=0, num=self.chunk_size)
+            for member in members:
+                yield member.decode("utf-8")
+            if len(members) < self.chunk_size:
+                break
+            low = b"(" + members[-1]
+
+    def iter_members(self, prefix=""):
+        """ yields the members starting with `prefix`, chunk_size at a time """
+        for keys in chunked(self.iter_keys(prefix), self.chunk_size):
+            for value in self.cache.get_many(keys).values():
+                yield value
+
+    @metrics.instrument("cache.members")
     def members(self, prefix=""):
-        if prefix:
-            prefix = self.get_key(prefix)
-        members = self.con.smembers(self.array_key)
-        keys = [m.decode("utf-8") for m in members if m.decode("utf-8").startswith(prefix)]
-        retval = self.cache.get_many(keys).values()
+        keys = self.keys(prefix)
+        if not keys:
+            return []
+        return self.cache.get_many(keys).values()
 
-        # extend key life
-        # for key in keys:
-        #     self.cache.expire(key, self.timeout)
+    @metrics.instrument("cache.group")
+    def group(self, group):
+        """ members whose key starts with `group:` """
+        return self.members("{}:".format(group))
 
-        return retval
+    def clear(self):
+        """ removes the keys from the index with their values, a chunk at
+            a time
+        """
+        start = len(self.prefix) + 1
+        for keys in chunked(self.iter_keys(), self.chunk_size):
+            pipe = self.pipeline()
+            pipe.zrem(self.array_key, *keys)
+            pipe.unlink(*[self.make_key(key[start:]) for key in keys])
+            pipe.execute()
+        self.touch()
+
+
+class LocalCache(object):
+    """ process-local LRU of decoded querysets, each valid for one
+        binding version, compared as given
+    """
+
+    def __init__(self, max_entries=64, max_objects=100000):
+        self.max_entries = max_entries
+        self.max_objects = max_objects
+        self.entries = OrderedDict()
+        self.objects = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self.objects -= len(entry[1])
+                return None
+            # reinsert to mark as most recently used
+            self.entries[key] = entry
+            return entry[1]
+
+    def set(self, key, version, objects):
+        if len(objects) > self.max_objects:
+            return
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.objects -= len(entry[1])
+            self.entries[key] = (version, objects)
+            self.objects += len(objects)
+            while (
+                len(self.entries) > self.max_entries or
+                self.objects > self.max_objects
+            ):
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.objects -= len(evicted)
+
+    def discard(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.objects -= len(entry[1])
 
     def clear(self):
-        members = self.con.smembers(self.array_key)
-        for key in members:
-            self.cache.delete(key)
-            self.con.srem(self.array_key, key)
+        with self.lock:
+            self.entries.clear()
+            self.objects = 0
+
+
+class SaveBatch(object):
+    """ shares one save between the bindings of a model: each serialized
+        object is written once, and the bindings' membership updates and
+        version bumps go out in a single transaction per cache
+    """
+
+    def __init__(self):
+        self.serialized = {}
+        self.stored = set()
+        self.pending = []
+
+    def serialize(self, binding, instance):
+        """ the serialized instance and whether it still has to be stored """
+        identity = binding.get_object_identity()
+        if identity not in self.serialized:
+            self.serialized[identity] = binding.serialize_object(instance)
+        store = identity not in self.stored
+        self.stored.add(identity)
+        return self.serialized[identity], store
+
+    def add(self, binding, instance, created):
+        self.pending.append((binding, instance, created))
+
+    def execute(self):
+        saves = OrderedDict()
+        for binding, instance, created in self.pending:
+            key = binding.get_instance_key(instance)
+            serialized, store = self.serialize(binding, instance)
+            saves.setdefault(binding.cache_name, []).append(
+                (binding, key, serialized, store, created))
+        self.pending = []
+        for cache_saves in saves.values():
+            self.write(cache_saves)
+
+    def write(self, saves):
+        """ writes the saves of bindings sharing a cache in one MULTI """
+        watch = []
+        for binding, key, serialized, store, created in saves:
+            watch.extend(binding.get_index_keys())
+
+        def read(pipe):
+            return [
+                binding._indexed_values([key], pipe) if binding.indexes
+                else None
+                for binding, key, serialized, store, created in saves
+            ]
+
+        positions = []
+
+        def queue(pipe, indexed):
+            del positions[:]
+            for save, values in zip(saves, indexed):
+                binding, key, serialized, store, created = save
+                binding.queue_save(pipe, key, serialized, store, values)
+                positions.append(len(pipe) - 1)
+
+        results = saves[0][0].meta_cache.transaction(queue, watch, read)
+        for save, position in zip(saves, positions):
+            binding, key, serialized, store, created = save
+            binding.saved(results[position], key, serialized, created)
 
 
 class Binding(object):
     bindings = CacheArray("binding-list", timeout=4 * 60 * 60)
+    local_objects = LocalCache()
     model = None
     filters = None
     excludes = None
 
+    # keep a decoded copy of all() in process memory while the version
+    # in the cache stays the same
+    local_cache = False
+
+    # write objects, membership, index entries and the version bump
+    # in a single MULTI transaction
+    atomic_writes = False
+
+    # page in ordering_field order (the lookup field when not given)
+    # instead of key order. either way member keys are kept in a sorted
+    # set, ties are in key order as strings
+    ordered = False
+    ordering_field = None
+
+    # remember which keys changed in roughly the last `changelog_size`
+    # versions so clients that are a little behind can catch up
+    changelog_size = 0
+
+    # fields kept in per-value sets of keys so filter() can be answered
+    # in redis without reading every object
+    indexes = ()
+
+    # store objects as "json" or "msgpack" encoded field dicts
+    # instead of pickled model instances
+    codec = None
+
+    # spread member keys over this many redis sets, for bindings
+    # too large to read or change in a single set
+    shards = 1
+
+    # keep objects in bucketed redis hashes instead of a key each,
+    # needs a codec, see HashCacheDict
+    hashed_objects = False
+
     # no promises this will work without cache or db
     cache_name = "default"
     meta_cache = None
     object_cache = None
     db = True
     _version = None
+    _predicate = None
 
     @classmethod
     def clear_all(self, objects=False):
@@ -145,7 +961,7 @@ class Binding(object):
 
     @classmethod
     def reset_all(self, objects=False):
-        for binding in Binding.bindings.members():
+        for binding in Binding.bindings.iter_members():
             binding.clear(objects)
 
     @classmethod
@@ -175,7 +991,8 @@ class Binding(object):
 
     def __getstate__(self):
         odict = self.__dict__.copy()
-        for key in ['_version', 'bindings', 'meta_cache', 'object_cache']:
+        for key in ['_version', '_predicate', 'bindings', 'meta_cache',
+                    'member_set', 'object_cache']:
             if key in odict:
                 del odict[key]
         return odict
@@ -185,6 +1002,7 @@ class Binding(object):
             data = self._unload(data)
         self.__dict__.update(data)
         self.meta_cache = self.create_meta_cache()
+        self.member_set = self.create_member_set()
         self.object_cache = self.create_object_cache()
 
     def __init__(self, model=None, name=None):
@@ -197,6 +1015,7 @@ class Binding(object):
 
         self.name = name
         self.meta_cache = self.create_meta_cache()
+        self.member_set = self.create_member_set()
         self.object_cache = self.create_object_cache()
         self.get_or_start_version()
         self.bindings_key = "{}:{}".format(self.model.__name__, self.name)
@@ -221,11 +1040,26 @@ class Binding(object):
             cache_name=self.cache_name
         )
 
+    def create_member_set(self):
+        return MemberSet(self.meta_cache, "objects", self.shards)
+
     def create_object_cache(self):
-        return CacheDict(
-            prefix="binding:object:{}".format(
-                self.model.__name__),
-            cache_name=self.cache_name
+        prefix = "binding:object:{}".format(self.model.__name__)
+        codec = get_codec(self.codec)
+        if codec:
+            prefix = "{}:{}".format(prefix, codec.name)
+        cls = CacheDict
+        if self.hashed_objects:
+            if not codec:
+                # compressed pickles are far past hash-max-listpack-value
+                raise ImproperlyConfigured(
+                    "hashed_objects requires a codec: {}".format(self.name))
+            prefix = "{}:hash".format(prefix)
+            cls = HashCacheDict
+        return cls(
+            prefix=prefix,
+            cache_name=self.cache_name,
+            codec=codec
         )
 
     def dispose(self):
@@ -233,11 +1067,56 @@ class Binding(object):
         if self in home:
             home.remove(self)
 
+    def reshard(self, previous, chunk_size=1000):
+        """ moves the member keys from the sets of `previous` shards to
+            the current ones. keys added meanwhile by processes still
+            using the old count are picked up by the next refresh
+        """
+        old = MemberSet(self.meta_cache, "objects", previous)
+        for chunk in chunked(old.iter(chunk_size), chunk_size):
+            self.member_set.add(*[k.decode("utf8") for k in chunk])
+        self.meta_cache.unlink(old.keys)
+        self.meta_cache.set("shards", self.shards)
+
+    def get_meta_keys(self):
+        """ the redis keys of the binding's metadata, except the index
+            value sets which are listed in the "index-values" set
+        """
+        keys = [
+            self.meta_cache.make_key(name)
+            for name in (
+                "version", "last-modified", "changelog-floor", "shards",
+                "index-layout")
+        ]
+        keys.extend(self.member_set.keys)
+        keys.extend(
+            self.meta_cache.get_key(name) for name in ("changes", "ordered")
+        )
+        keys.extend(
+            self.meta_cache.get_key(self.get_index_key(field))
+            for field in self.indexes
+        )
+        return keys
+
     def clear(self, objects=False):
-        self.meta_cache.clear()
-        self.meta_cache.set_clear("objects")
+        """ readers see an empty binding as soon as its metadata is
+            unlinked, the index value sets go afterwards. with `objects`,
+            the cached objects of its members are unlinked too. cached list
+            responses are keyed by last modified time, which changes, so
+            they're left to expire
+        """
+        self.local_objects.discard(self.local_key)
+        names = None
         if objects:
-            self.object_cache.clear()
+            names = [k.decode("utf8") for k in self.member_set.iter()]
+        footprint = self.meta_cache.get_key("index-values")
+        keys = self.get_meta_keys()
+        if self.indexes and not self.meta_cache.con.exists(footprint):
+            # value sets indexed before they were listed
+            keys.extend(self._index_value_keys())
+        self.meta_cache.retire(keys, [footprint])
+        if names:
+            self.object_cache.unlink(self.object_cache.storage_keys(names))
 
     def get_lookup_field(self):
         return 'id'
@@ -245,49 +1124,493 @@ class Binding(object):
     def get_instance_key(self, instance):
         return str(getattr(instance, self.get_lookup_field()))
 
-    def model_saved(self, instance=None, created=None, **kwargs):
+    def model_saved(self, instance=None, created=None, batch=None, **kwargs):
         """ save hook called when by signal """
         if self.model_matches(instance):
-            self.save_instance(instance, created)
-        elif self.meta_cache.set_exists("objects", self.get_instance_key(instance)):
+            self.save_instance(instance, created, batch=batch)
+        elif self.member_set.exists(self.get_instance_key(instance)):
             self.delete_instance(instance)
 
     def model_deleted(self, instance=None, **kwargs):
         """ delete hook called when by signal """
         self.delete_instance(instance)
 
-    def save_instance(self, instance, created):
-        """ called when a matching model is saved """
+    @metrics.instrument("save_instance")
+    def save_instance(self, instance, created, batch=None):
+        """ called when a matching model is saved, returns the new version.
+            with a SaveBatch the write waits for the batch to execute, and
+            goes out atomically with the other bindings' writes
+        """
+        if batch is not None:
+            batch.add(self, instance, created)
+            return None
+
+        key = self.get_instance_key(instance)
         serialized = self.serialize_object(instance)
-        self.object_cache.set(str(self.get_instance_key(instance)), serialized)
-        self.meta_cache.set_add("objects", self.get_instance_key(instance))
-        self.bump()
+        if self.atomic_writes:
+            version = self._indexed_transaction(
+                [key], lambda pipe, indexed: self.queue_save(
+                    pipe, key, serialized, indexed=indexed))[-1]
+            self.saved(version, key, serialized, created)
+        else:
+            self.object_cache.set(key, serialized)
+            self.member_set.add(key)
+            self._index_objects({key: serialized})
+            version = self.bump([key])
+            self.message(created and "create" or "update", serialized)
+        return version
+
+    def queue_save(self, pipe, key, serialized, store=True, indexed=None):
+        """ queues an atomic save, the last command is the version bump """
+        if store:
+            self.object_cache.queue_set(pipe, key, serialized)
+        self.member_set.queue_add(pipe, key)
+        self._index_objects({key: serialized}, pipe, indexed)
+        self._queue_bump(pipe, [key])
+
+    def queue_delete(self, pipe, key, indexed):
+        """ queues an atomic delete of a member, `indexed` are its index
+            values or None when it isn't a member. the last command is the
+            version bump
+        """
+        if indexed is None:
+            return
+        self.member_set.queue_remove(pipe, key)
+        self._unindex_keys([key], pipe=pipe, indexed=indexed)
+        self._queue_bump(pipe, [key])
+
+    def saved(self, version, key, serialized, created):
+        """ called once a queued save has been written """
+        self._version = None
+        self.log_changes(version, [key])
         self.message(created and "create" or "update", serialized)
 
+    def get_object_identity(self):
+        """ bindings with the same identity store the same serialized
+            objects in the same place, so a save is serialized and written
+            once for all of them. override if serialize_object depends on
+            the binding's own attributes
+        """
+        return (
+            self.cache_name,
+            self.object_cache.prefix,
+            self.get_lookup_field(),
+            getattr(self.serialize_object, "__func__", self.serialize_object),
+        )
+
+    @metrics.instrument("delete_instance")
     def delete_instance(self, instance):
-        """ called when a matching model is deleted """
+        """ called when a matching model is deleted, returns the new version
+            or None when the instance wasn't part of the binding
+        """
         # self.object_cache.expire(self.get_instance_key(instance))
-        if self.meta_cache.set_remove("objects", self.get_instance_key(instance)):
-            self.bump()
+        key = self.get_instance_key(instance)
+        if self.atomic_writes:
+            shard = self.member_set.get_shard_key(key)
+
+            def read(pipe):
+                # only members are removed and bumped
+                if not pipe.sismember(shard, key):
+                    return None
+                return self._indexed_values([key], pipe) if self.indexes else {}
+
+            results = self.meta_cache.transaction(
+                lambda pipe, indexed: self.queue_delete(pipe, key, indexed),
+                [shard] + self.get_index_keys(), read)
+            version = results[-1] if results else None
+            self._version = None
+            self.log_changes(version, [key])
+        elif self.member_set.remove(key):
+            self._unindex_keys([key])
+            version = self.bump([key])
+        else:
+            version = None
+        if version:
             self.message("delete", instance)
+        return version
 
     def save_many_instances(self, instances):
         """ called when the binding is first attached """
         self.object_cache.set_many(instances)
+        self._index_objects(instances)
+
+        if instances and self.member_set.add(*instances.keys()):
+            self.bump(list(instances.keys()))
+
+    @metrics.instrument("models_saved")
+    def models_saved(self, instances, missing=()):
+        """ bulk version of model_saved for changes that bypass signals
+            (bulk_create, QuerySet.update), accepts instances or lookup
+            field values. `missing` are primary keys of rows found gone.
+            returns the new version or None when nothing changed
+        """
+        instances, gone = load_instances(
+            self.model, instances, self.get_lookup_field())
+        saved = {}
+        removed = [str(value) for value in gone] + self.get_pk_keys(missing)
+        matching = self.models_matching(instances)
+        for instance in instances:
+            key = self.get_instance_key(instance)
+            if instance.pk in matching:
+                saved[key] = self.serialize_object(instance)
+            else:
+                removed.append(key)
+        return self._apply_changes(saved, removed)
+
+    @metrics.instrument("models_deleted")
+    def models_deleted(self, instances):
+        """ bulk version of model_deleted, accepts instances or lookup
+            field values
+        """
+        return self._apply_changes({}, [
+            self.get_instance_key(instance)
+            if isinstance(instance, self.model) else str(instance)
+            for instance in instances
+        ])
 
-        changed = False
-        for pk in instances.keys():
-            changed = self.meta_cache.set_add("objects", pk) or changed
+    def get_pk_keys(self, pks):
+        """ the keys of rows known only by primary key, which are only
+            known when the lookup field is the primary key
+        """
+        pk = self.model._meta.pk
+        if self.get_lookup_field() not in ("pk", pk.name, pk.attname):
+            return []
+        return [str(value) for value in pks]
+
+    def _apply_changes(self, saved, removed, chunk_size=1000):
+        """ writes serialized objects and drops removed keys, chunk_size
+            at a time, with a single bump and a single "bulk" message
+        """
+        for chunk in chunked(saved.items(), chunk_size):
+            chunk = dict(chunk)
+            self.object_cache.set_many(chunk)
+            self.member_set.add(*chunk.keys())
+            self._index_objects(chunk)
+        if removed:
+            removed = self.member_set.contains(removed)
+        for chunk in chunked(removed, chunk_size):
+            self.member_set.remove(*chunk)
+            self._unindex_keys(chunk)
+        if not saved and not removed:
+            return None
+
+        version = self.bump(list(saved.keys()) + removed)
+        self.message("bulk", dict(update=saved, delete=removed))
+        return version
+
+    def get_ordering_field(self):
+        return self.ordering_field or self.get_lookup_field()
+
+    def get_field_value(self, obj, field):
+        """ a field of a serialized object, which may be a dict """
+        if isinstance(obj, dict):
+            return obj.get(field)
+        return getattr(obj, field, None)
+
+    def get_score(self, key, obj):
+        """ the page order score of a member """
+        if self.ordered:
+            return self.get_ordering_score(obj)
+        return natural_score(key)
+
+    def stored_score(self, key):
+        """ the page order score a member was indexed with, or None """
+        return self.meta_cache.sorted_score("ordered", key)
+
+    def get_ordering_score(self, obj):
+        """ sorted set score for a serialized object, objects that can't be
+            scored numerically share 0 and fall back to key order
+        """
+        value = self.get_field_value(obj, self.get_ordering_field())
+        if isinstance(value, six.string_types):
+            # codecs store dates as iso strings
+            value = parse_temporal(value)
+        if isinstance(value, datetime.datetime):
+            return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+        if isinstance(value, datetime.date):
+            return calendar.timegm(value.timetuple())
+        if isinstance(value, Number):
+            return float(value)
+        return 0
+
+    def get_index_key(self, field, value=None):
+        """ the hash of indexed values for a field, or the set of keys
+            having one of its values
+        """
+        if value is None:
+            return "index:{}".format(field)
+        return "index:{}:{}".format(field, value)
+
+    def get_index_value(self, value):
+        """ the string a field value is indexed under, booleans and None
+            are written the way they're sent in query strings
+        """
+        if value is None:
+            return "null"
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return six.text_type(value)
+
+    def _indexed_values(self, keys, con=None):
+        """ the currently indexed value of each key, per field """
+        if con is not None:
+            # a pipeline watching the indexes runs commands right away
+            return dict(
+                (field, con.hmget(
+                    self.meta_cache.get_key(self.get_index_key(field)), keys))
+                for field in self.indexes
+            )
+        pipe = self.meta_cache.pipeline(transaction=False)
+        for field in self.indexes:
+            pipe.hmget(
+                self.meta_cache.get_key(self.get_index_key(field)), keys)
+        return dict(zip(self.indexes, pipe.execute()))
+
+    def get_index_keys(self):
+        """ the full redis keys of the field index hashes """
+        return [
+            self.meta_cache.get_key(self.get_index_key(field))
+            for field in self.indexes
+        ]
 
-        if changed:
-            self.bump()
+    def _indexed_transaction(self, keys, queue, watch=()):
+        """ executes what `queue(pipe, indexed)` queues in a MULTI, where
+            `indexed` are the values of `keys` read while watching the
+            field indexes and the full redis keys in `watch`
+        """
+        def read(pipe):
+            return self._indexed_values(keys, pipe) if self.indexes else None
+        return self.meta_cache.transaction(
+            queue, list(watch) + self.get_index_keys(), read)
+
+    def _index_objects(self, objects, pipe=None, indexed=None):
+        """ adds serialized objects to the page order and field indexes.
+            on a pipeline, `indexed` are their current values, read while
+            watching the indexes
+        """
+        if not objects:
+            return
+        if pipe is None:
+            self._indexed_transaction(
+                list(objects.keys()),
+                lambda pipe, indexed: self._index_objects(
+                    objects, pipe, indexed))
+            return
+
+        self.meta_cache.queue_sorted_add(pipe, "ordered", dict(
+            (key, self.get_score(key, obj)) for key, obj in objects.items()
+        ))
+
+        if self.indexes:
+            keys = list(objects.keys())
+            for field in self.indexes:
+                values = {}
+                moved = {}
+                for key, previous in zip(keys, indexed[field]):
+                    value = self.get_index_value(
+                        self.get_field_value(objects[key], field))
+                    values.setdefault(value, []).append(key)
+                    if previous is not None and previous.decode("utf8") != value:
+                        moved.setdefault(previous.decode("utf8"), []).append(key)
+                for value, moving in moved.items():
+                    pipe.srem(self.meta_cache.get_key(
+                        self.get_index_key(field, value)), *moving)
+                for value, adding in values.items():
+                    self.meta_cache.queue_set_add(
+                        pipe, self.get_index_key(field, value), *adding)
+                if values:
+                    # lets clear() find the value sets without reading the index
+                    self.meta_cache.queue_set_add(pipe, "index-values", *[
+                        self.meta_cache.get_key(self.get_index_key(field, value))
+                        for value in values
+                    ])
+                pipe.hset(
+                    self.meta_cache.get_key(self.get_index_key(field)),
+                    mapping=dict(
+                        (key, value)
+                        for value, adding in values.items() for key in adding
+                    )
+                )
+
+    def _unindex_keys(self, keys, ordered=True, pipe=None, indexed=None):
+        if not keys:
+            return
+        if pipe is None:
+            if ordered or self.indexes:
+                self._indexed_transaction(
+                    keys,
+                    lambda pipe, indexed: self._unindex_keys(
+                        keys, ordered, pipe, indexed))
+            return
+        if ordered:
+            pipe.zrem(self.meta_cache.get_key("ordered"), *keys)
+        if self.indexes:
+            for field in self.indexes:
+                values = {}
+                for key, value in zip(keys, indexed[field]):
+                    if value is not None:
+                        values.setdefault(value.decode("utf8"), []).append(key)
+                for value, removing in values.items():
+                    pipe.srem(self.meta_cache.get_key(
+                        self.get_index_key(field, value)), *removing)
+                pipe.hdel(
+                    self.meta_cache.get_key(self.get_index_key(field)), *keys)
+
+    def _index_value_keys(self):
+        """ the value sets found in the field indexes """
+        keys = []
+        for field in self.indexes:
+            values = self.meta_cache.con.hvals(
+                self.meta_cache.get_key(self.get_index_key(field)))
+            keys.extend(
+                self.meta_cache.get_key(
+                    self.get_index_key(field, value.decode("utf8")))
+                for value in set(values)
+            )
+        return keys
+
+    def get_index_layout(self):
+        """ describes how the indexes are built, they're rebuilt once when
+            it changes
+        """
+        return repr((
+            self.ordered and self.get_ordering_field(),
+            tuple(self.indexes or ()),
+        ))
+
+    def _index_sources(self, keys):
+        """ what the indexes are built from for `keys`: the cached objects,
+            or the serialized rows of those missing from the cache
+        """
+        objects = self.object_cache.get_many(keys)
+        missing = [key for key in keys if key not in objects]
+        if missing and (self.ordered or self.indexes):
+            instances, gone = load_instances(
+                self.model, missing, self.get_lookup_field())
+            objects.update(
+                (self.get_instance_key(instance),
+                 self.serialize_object(instance))
+                for instance in instances)
+        return objects
+
+    def rebuild_indexes(self, chunk_size=1000):
+        """ recreates the page order and field indexes of the members into
+            temporary keys, renamed into place at the end so readers keep
+            the old indexes meanwhile. every member gets a page score, an
+            object missing from the cache is read from the database
+        """
+        token = uuid.uuid4().hex
+        built = OrderedDict()
+
+        def temporary(name):
+            live = self.meta_cache.get_key(name)
+            if live not in built:
+                built[live] = self.meta_cache.get_key(
+                    "rebuild:{}:{}".format(token, name))
+            return built[live]
+
+        for chunk in chunked(self.member_set.iter(chunk_size), chunk_size):
+            keys = [k.decode("utf8") for k in chunk]
+            objects = self._index_sources(keys)
+            pipe = self.meta_cache.pipeline(transaction=False)
+            pipe.zadd(temporary("ordered"), dict(
+                (key, self.get_score(key, objects.get(key))) for key in keys
+            ))
+            for field in self.indexes:
+                values = {}
+                for key, obj in objects.items():
+                    value = self.get_index_value(
+                        self.get_field_value(obj, field))
+                    values.setdefault(value, []).append(key)
+                for value, adding in values.items():
+                    pipe.sadd(
+                        temporary(self.get_index_key(field, value)), *adding)
+                if values:
+                    pipe.hset(temporary(self.get_index_key(field)), mapping=dict(
+                        (key, value)
+                        for value, adding in values.items() for key in adding
+                    ))
+            # left behind by a rebuild that didn't finish
+            for key in built.values():
+                pipe.expire(key, 60 * 60)
+            pipe.execute()
+
+        stale = [self.meta_cache.get_key("ordered")] + self.get_index_keys()
+        stale.extend(self._index_value_keys())
+        footprint = self.meta_cache.get_key("index-values")
+        stale.extend(
+            key.decode("utf8") for key in self.meta_cache.con.smembers(footprint))
+        pipe = self.meta_cache.pipeline()
+        for live in stale:
+            if live not in built:
+                pipe.delete(live)
+        for live, key in built.items():
+            pipe.rename(key, live)
+            pipe.persist(live)
+        pipe.delete(footprint)
+        value_keys = [
+            live for live in built
+            if live != self.meta_cache.get_key("ordered") and
+            live not in self.get_index_keys()
+        ]
+        if value_keys:
+            pipe.sadd(footprint, *value_keys)
+        self.meta_cache.queue_set(pipe, "index-layout", self.get_index_layout())
+        pipe.execute()
 
     def model_matches(self, instance):
         """ called to determine if the model is part of the queryset """
-        for key, value in self.get_filters().items():
-            if getattr(instance, key, None) != value:
-                return False
-        return True
+        matches = self._predicate_matches(self.get_predicate(), instance)
+        if matches is not None:
+            return matches
+        # lookups that can't be checked in python ask the database
+        return self.get_queryset().filter(pk=instance.pk).exists()
+
+    def models_matching(self, instances, chunk_size=1000):
+        """ model_matches for many instances, the primary keys of those
+            that are part of the queryset. the ones python can't answer are
+            checked with a pk__in query per chunk
+        """
+        predicate = self.get_predicate()
+        matching, unknown = set(), []
+        for instance in instances:
+            matches = self._predicate_matches(predicate, instance)
+            if matches is None:
+                unknown.append(instance.pk)
+            elif matches:
+                matching.add(instance.pk)
+        queryset = self.get_queryset()
+        for chunk in chunked(unknown, chunk_size):
+            matching.update(
+                queryset.filter(pk__in=chunk).values_list("pk", flat=True))
+        return matching
+
+    def _predicate_matches(self, predicate, instance):
+        """ the predicate's answer, None when it has none: a value it can't
+            compare or a related object that isn't there
+        """
+        if predicate is None:
+            return None
+        try:
+            return predicate(instance)
+        except (AttributeError, ObjectDoesNotExist, TypeError, ValueError):
+            return None
+
+    def get_predicate(self):
+        """ filters, excludes and q compiled into a python function,
+            recompiled when they change. None when they can't be compiled
+        """
+        filters = self.get_filters()
+        excludes = self.get_excludes()
+        q = self.get_q()
+        current = signature((filters, excludes, q))
+        if self._predicate is None or self._predicate[0] != current:
+            try:
+                predicate = compile_predicate(self.model, filters, excludes, q)
+            except Unsupported:
+                predicate = None
+            self._predicate = (current, predicate)
+        return self._predicate[1]
 
     def get_q(self):
         return tuple()
@@ -298,38 +1621,88 @@ class Binding(object):
     def get_excludes(self):
         return self.excludes
 
-    def refresh(self, timeout=0):
-        db_objects = self._get_queryset_from_db()
-        objects = self.meta_cache.set_all("objects") or []
-        objects = [k.decode() for k in objects]
-        remove_these = set(objects) - set([self.get_instance_key(o) for o in db_objects])
-        added = removed = 0
+    @metrics.instrument("refresh")
+    def refresh(self, timeout=0, chunk_size=1000, progress=None):
+        """ brings the cache in line with the database a chunk at a time,
+            with a single version bump at the end. each chunk of changes is
+            sent as a "bulk" message, the last one after the bump.
+
+            `progress` is called after each chunk with the number of rows
+            checked, added and removed so far
+        """
+        lookup = self.get_lookup_field()
+        objects = self.member_set.all() or []
+        objects = set(k.decode() for k in objects)
+        seen = set()
+        changes = []
+        pending = []
+        added = removed = checked = 0
+
+        def changed(update, delete):
+            # a chunk's message waits for the next one, so the last goes
+            # out with the new version
+            changes.extend(list(update.keys()) + delete)
+            if pending:
+                self.message("bulk", pending.pop())
+            pending.append(dict(update=update, delete=delete))
 
         # ensure that all objects are in the list that should be
-        for obj in db_objects:
-            key = self.get_instance_key(obj)
-            shared = self.object_cache.get(key)
-            if key not in objects or not shared:
-                # print("  - saving", obj)
-                self.save_instance(obj, False)
-                added += 1
-                if timeout:
-                    time.sleep(timeout)
+        keys = self._get_queryset_from_db().values_list(
+            lookup, flat=True).iterator()
+        for chunk in chunked((str(k) for k in keys), chunk_size):
+            seen.update(chunk)
+            shared = self.object_cache.get_many_raw(chunk)
+            missing = [
+                key for key in chunk
+                if key not in objects or key not in shared
+            ]
+            if missing:
+                new_objects = dict(
+                    (self.get_instance_key(o), self.serialize_object(o))
+                    for o in self._get_queryset_from_db().filter(
+                        **{lookup + "__in": missing})
+                )
+                self.object_cache.set_many(new_objects)
+                if new_objects:
+                    self.member_set.add(*new_objects.keys())
+                    self._index_objects(new_objects)
+                    changed(new_objects, [])
+                added += len(new_objects)
+            checked += len(chunk)
+            if progress:
+                progress(checked, added, removed)
+            if timeout:
+                time.sleep(timeout)
 
         # remove objects from the list that shouldn't be
-        for key in remove_these:
-            try:
-                lookup = self.get_lookup_field()
-                obj = self.model.objects.get(**{lookup: key})
-            except self.model.DoesNotExist:
-                obj = self.model(**{lookup: key})
-            # print("  - delete", obj)
-            self.delete_instance(obj)
-            removed += 1
+        for chunk in chunked(objects - seen, chunk_size):
+            self.member_set.remove(*chunk)
+            self._unindex_keys(chunk)
+            # the objects of rows gone from the database aren't shared
+            # with any binding any more
+            rows = self.existing_keys(chunk)
+            self.object_cache.delete_many(
+                [key for key in chunk if key not in rows])
+            changed({}, chunk)
+            removed += len(chunk)
+            if progress:
+                progress(checked, added, removed)
             if timeout:
                 time.sleep(timeout)
+
+        if changes:
+            # too many keys to log, older versions have to resync
+            self.bump(changes if len(changes) <= chunk_size else None)
+            self.message("bulk", pending.pop())
         return added, removed
 
+    def existing_keys(self, keys):
+        """ the keys among `keys` that still have a row in the database """
+        lookup = self.get_lookup_field()
+        rows = self.model._base_manager.filter(
+            **{lookup + "__in": keys}).values_list(lookup, flat=True)
+        return set(str(key) for key in rows)
+
     def _get_queryset(self):
         objects = self._get_queryset_from_cache()
         if self.db and objects is None:
@@ -344,7 +1717,10 @@ class Binding(object):
                     new_objects[key] = objects[key]
             self.object_cache.set_many(new_objects)
             if len(objects.keys()):
-                self.meta_cache.set_add("objects", *objects.keys())
+                self.member_set.add(*objects.keys())
+                self._index_objects(objects)
+            # filled from scratch, the indexes are complete
+            self.meta_cache.set("index-layout", self.get_index_layout())
             self.bump()
         return objects or {}
 
@@ -352,12 +1728,31 @@ class Binding(object):
     def cache_key(self):
         return self.meta_cache.get_key("objects")
 
+    @property
+    def local_key(self):
+        return "{}:{}".format(self.cache_name, self.cache_key)
+
     def _get_queryset_from_cache(self):
-        keys = self.meta_cache.set_all("objects") or None
+        version = None
+        if self.local_cache:
+            # read the version before the objects so a concurrent write
+            # can only leave newer data under an older version. versions
+            # start over after a clear, the last modified time doesn't
+            version = self.metadata()
+            qs = self.local_objects.get(self.local_key, version)
+            if qs is not None:
+                metrics.count(self.name, "hits")
+                return dict(qs)
+
+        keys = self.member_set.all() or None
+        metrics.count(self.name, "misses" if keys is None else "hits")
         if keys is not None:
             keys = [k.decode("utf8") for k in keys]
-            qs = self.object_cache.get_many(keys)
+            qs = self.object_cache.get_all(keys)
             # print("cache returned:", keys, qs)
+            if version is not None:
+                self.local_objects.set(self.local_key, version, qs)
+                return dict(qs)
             return qs
         return None
 
@@ -379,10 +1774,24 @@ class Binding(object):
     @property
     def version(self):
         if not self._version:
-            self._version = self.meta_cache.get("version", None)
+            self._version = self.current_version()
         return self._version
 
+    def current_version(self):
+        """ reads the version from the cache, skipping the local copy """
+        return self.meta_cache.get("version", None)
+
     def get_or_start_version(self):
+        shards = self.meta_cache.get("shards")
+        if shards is None:
+            self.meta_cache.set("shards", self.shards)
+        elif shards != self.shards:
+            self.reshard(shards)
+
+        # not when the counts differ, which they do while others write
+        if self.meta_cache.get("index-layout") != self.get_index_layout():
+            self.rebuild_indexes()
+
         v = self.version
         if not v:
             v = 0
@@ -394,44 +1803,260 @@ class Binding(object):
         if not lm:
             self.meta_cache.set("last-modified", timezone.now())
 
+        if self.changelog_size and self.meta_cache.get("changelog-floor") is None:
+            self.log_changes(self.current_version())
+
+
     @property
     def last_modified(self):
         return self.meta_cache.get("last-modified")
 
-    def bump(self):
+    @metrics.instrument("metadata")
+    def metadata(self):
+        """ the current version and last modified time, in one round trip """
+        values = self.meta_cache.get_many(["version", "last-modified"])
+        return values.get("version"), values.get("last-modified")
+
+    def _queue_bump(self, pipe, changes=None):
+        """ queues the version bump, with the changed keys logged in the
+            same step. the last command returns the new version
+        """
+        if self.changelog_size and changes:
+            # sent as EVAL, it works the same on asyncio pipelines
+            pipe.eval(
+                BUMP_SCRIPT, 3,
+                self.meta_cache.make_key("last-modified"),
+                self.meta_cache.make_key("version"),
+                self.meta_cache.get_key("changes"),
+                self.meta_cache.encode(timezone.now()),
+                *changes)
+            return
+        self.meta_cache.queue_set(pipe, "last-modified", timezone.now())
+        pipe.incr(self.meta_cache.make_key("version"))
+
+    @metrics.instrument("bump")
+    def bump(self, changes=None):
+        """ moves to a new version, `changes` are the keys that changed
+            or None when they aren't known
+        """
         # print("\n")
         # import traceback
         # traceback.print_stack()
         # print("*" * 20)
         # print("bumping version", self.version)
 
-        self.meta_cache.set("last-modified", timezone.now())
         self._version = None
-        try:
-            return self.meta_cache.incr("version")
-        except ValueError:
-            # import traceback
-            # traceback.print_stack()
-            # print("couldn't get version", self.meta_cache.get("version"))
-            self.meta_cache.set("version", 1)
-            return 1
+        # both values change in one MULTI, INCR starts a missing version
+        pipe = self.meta_cache.pipeline()
+        self._queue_bump(pipe, changes)
+        version = pipe.execute()[-1]
+        self.log_changes(version, changes)
+        return version
+
+    def log_changes(self, version, keys=None):
+        """ called after `version` was bumped with the changed `keys`,
+            which the bump added to the changelog. trims the changelog to
+            changelog_size, unknown changes mean older versions can't be
+            caught up
+        """
+        if not self.changelog_size or version is None:
+            return
+        if keys is None:
+            self.meta_cache.set("changelog-floor", version)
+            return
+        if not keys:
+            return
+
+        # each key only keeps the last version it changed in
+        overflow = self.meta_cache.sorted_length("changes") - self.changelog_size
+        if overflow > 0:
+            # versions up to the newest dropped entry can't be caught up
+            dropped = self.meta_cache.sorted_range(
+                "changes", overflow - 1, overflow - 1, withscores=True)
+            self.meta_cache.sorted_trim("changes", 0, overflow - 1)
+            if dropped:
+                floor = int(dropped[0][1])
+                if floor > (self.meta_cache.get("changelog-floor") or 0):
+                    self.meta_cache.set("changelog-floor", floor)
+
+    @metrics.instrument("changes_since")
+    def changes_since(self, version):
+        """ the changes made after `version` as
+            {"update": {key: object}, "delete": [key]}, or None when the
+            changelog doesn't reach back that far
+        """
+        if not self.changelog_size:
+            return None
+        floor = self.meta_cache.get("changelog-floor")
+        current = self.current_version()
+        if floor is None or current is None:
+            return None
+        if version < floor or version > current:
+            return None
+
+        keys = [
+            k.decode("utf8") for k in self.meta_cache.sorted_range_by_score(
+                "changes", "({}".format(version), "+inf")
+        ]
+        updated = self.object_cache.get_many(
+            self.member_set.contains(keys) if keys else [])
+        return dict(
+            update=updated,
+            delete=[key for key in keys if key not in updated],
+        )
 
     def message(self, action, data, **kwargs):
         pass
 
     def serialize_object(self, obj):
+        if self.codec:
+            return instance_to_dict(obj)
         return obj
 
     def serialize(self):
+        version, last_modified = self.metadata()
         return dict(
             name=self.name,
-            version=self.version,
-            last_modified=str(self.last_modified),
+            version=version,
+            last_modified=str(last_modified),
         )
 
     # queryset operations
+    @metrics.instrument("all")
     def all(self):
         return self._get_queryset()
 
+    def all_raw(self):
+        """ the encoded objects, only meaningful for bindings with a codec """
+        keys = self.keys()
+        if not keys:
+            self.all()
+            keys = self.keys()
+        return self.object_cache.get_many_raw([k.decode("utf8") for k in keys])
+
     def keys(self):
-        return self.meta_cache.set_all("objects") or []
+        return self.member_set.all() or []
+
+    @metrics.instrument("filter_keys")
+    def filter_keys(self, **kwargs):
+        """ member keys matching indexed field values, a list of values
+            matches any of them
+        """
+        pipe = self.meta_cache.pipeline(transaction=False)
+        for field, value in kwargs.items():
+            if field not in self.indexes:
+                raise ValueError("{} isn't an indexed field".format(field))
+            if not isinstance(value, (list, tuple, set)):
+                value = [value]
+            pipe.sunion([
+                self.meta_cache.get_key(
+                    self.get_index_key(field, self.get_index_value(v)))
+                for v in value
+            ])
+        keys = None
+        for matches in pipe.execute():
+            keys = matches if keys is None else keys & matches
+        return [k.decode("utf8") for k in keys or []]
+
+    def filter(self, **kwargs):
+        """ objects matching the given field values, indexed fields are
+            matched in redis and only the matching objects are read
+        """
+        indexed = dict(
+            (field, value) for field, value in kwargs.items()
+            if field in self.indexes
+        )
+        if indexed:
+            objects = self.object_cache.get_many(self.filter_keys(**indexed))
+        else:
+            objects = self.all()
+
+        for field, value in kwargs.items():
+            if field in indexed:
+                continue
+            objects = dict(
+                (key, obj) for key, obj in objects.items()
+                if self.get_field_value(obj, field) == value
+            )
+        return objects
+
+    def count(self):
+        return self.member_set.length()
+
+    def page_keys(self, offset, limit):
+        """ a slice of the member keys, in page order: ordering_field order
+            for ordered bindings and key order otherwise
+        """
+        keys = self.meta_cache.sorted_range("ordered", offset, offset + limit - 1)
+        return [k.decode("utf8") for k in keys]
+
+    def sorted_keys(self):
+        return [
+            k.decode("utf8")
+            for k in self.meta_cache.sorted_range("ordered", 0, -1)
+        ]
+
+    def offset_after(self, key, score=None):
+        """ the offset just past `key` in page order, or past where it
+            would be with `score` if it has been removed since
+        """
+        rank = self.meta_cache.sorted_rank("ordered", key)
+        if rank is not None:
+            return rank + 1
+        if score is None and not self.ordered:
+            score = natural_score(key)
+        if score is None:
+            return 0
+
+        # past the lower scores and the keys tied with it that sort
+        # before it, found by bisecting the ties
+        ordered = self.meta_cache.get_key("ordered")
+        con = self.meta_cache.con
+        low = con.zcount(ordered, "-inf", "({}".format(score))
+        high = low + con.zcount(ordered, score, score)
+        key = key.encode("utf8")
+        while low < high:
+            middle = (low + high) // 2
+            if con.zrange(ordered, middle, middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def sort_keys(self, keys, chunk_size=1000):
+        """ member `keys` in page order, the others are left out """
+        ordered = self.meta_cache.get_key("ordered")
+        scored = []
+        for chunk in chunked(keys, chunk_size):
+            scores = self.meta_cache.con.zmscore(ordered, chunk)
+            scored.extend(
+                (score, key) for key, score in zip(chunk, scores)
+                if score is not None
+            )
+        return [key for score, key in sorted(scored)]
+
+    def iter_raw(self, chunk_size=1000):
+        """ yields (key, stored bytes) for every member, reading chunk_size
+            objects at a time. the page index is walked with a ZSCAN cursor,
+            so not in page order. keys whose object is missing yield None
+        """
+        keys = []
+        for key in self.meta_cache.sorted_scan("ordered", chunk_size):
+            keys.append(key.decode("utf8"))
+            if len(keys) >= chunk_size:
+                for item in self._raw_items(keys):
+                    yield item
+                keys = []
+        for item in self._raw_items(keys):
+            yield item
+
+    def _raw_items(self, keys):
+        objects = self.object_cache.get_many_raw(keys)
+        return [(key, objects.get(key)) for key in keys]
+
+    @metrics.instrument("page")
+    def page(self, offset, limit):
+        """ the objects for a slice of the binding, in order """
+        keys = self.page_keys(offset, limit)
+        objects = self.object_cache.get_many(keys)
+        return OrderedDict((k, objects[k]) for k in keys if k in objects)
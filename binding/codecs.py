@@ -0,0 +1,82 @@
+import datetime
+import decimal
+import json
+import uuid
+
+import six
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def instance_to_dict(instance):
+    """ plain field values of a model instance, foreign keys as ids """
+    return dict(
+        (field.attname, field.value_from_object(instance))
+        for field in instance._meta.concrete_fields
+    )
+
+
+class JSONCodec(object):
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, value):
+        return json.dumps(
+            value, cls=DjangoJSONEncoder, separators=(",", ":")
+        ).encode("utf8")
+
+    def decode(self, value):
+        return json.loads(value.decode("utf8"))
+
+    def join(self, values):
+        """ a list of already encoded values """
+        return b"[" + b",".join(values) + b"]"
+
+
+class MsgpackCodec(object):
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImproperlyConfigured(
+                "The msgpack codec requires the msgpack package")
+
+    def encode(self, value):
+        return msgpack.packb(value, default=self.default, use_bin_type=True)
+
+    def decode(self, value):
+        return msgpack.unpackb(value, raw=False)
+
+    def join(self, values):
+        """ a list of already encoded values """
+        values = list(values)
+        return msgpack.Packer().pack_array_header(len(values)) + b"".join(values)
+
+    def default(self, value):
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, (decimal.Decimal, uuid.UUID)):
+            return str(value)
+        raise TypeError("Can't encode {!r}".format(value))
+
+
+codecs = {
+    "json": JSONCodec,
+    "msgpack": MsgpackCodec,
+}
+
+
+def get_codec(codec):
+    """ a codec instance from a name, or the codec itself """
+    if codec is None or not isinstance(codec, six.string_types):
+        return codec
+    try:
+        return codecs[codec]()
+    except KeyError:
+        raise ImproperlyConfigured("Unknown binding codec: {}".format(codec))
@@ -3,7 +3,7 @@ from websockets.views import WebsocketMixin
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .tasks import send_message, send_sync
+from .tasks import batcher, send_message, send_sync, stream_sync
 from .binding import Binding
 
 
@@ -12,6 +12,15 @@ class WebsocketBinding(Binding):
     group = None
     event = None
 
+    # stream full syncs in pages of up to this many stored bytes
+    # instead of one page per request
+    sync_max_bytes = None
+    sync_workers = 4
+
+    # collect change events for this many seconds and send them
+    # to each group in one packet
+    batch_window = None
+
     def get_user_group(self):
         return self.group
 
@@ -22,6 +31,27 @@ class WebsocketBinding(Binding):
             return [data]
         return data.values()
 
+    def get_event_key(self, data):
+        field = self.get_lookup_field()
+        if isinstance(data, dict):
+            return str(data.get(field))
+        return str(getattr(data, field))
+
+    def serialize_changes(self, data):
+        """ events for a "bulk" message, {"update": {key: obj}, "delete": [key]} """
+        events = []
+        if data["update"]:
+            events.append(dict(
+                action="update",
+                payload=list(data["update"].values())
+            ))
+        if data["delete"]:
+            events.append(dict(
+                action="delete",
+                payload=[{"id": key} for key in data["delete"]]
+            ))
+        return events
+
     def message(self, action, data, page=None, whom=None):
         if action == "ok":
             send_message(
@@ -29,12 +59,28 @@ class WebsocketBinding(Binding):
                 dict(action="sync", payload="ok"),
                 whom
             )
+        elif action == "sync" and self.sync_max_bytes and not page:
+            stream_sync.delay(
+                self,
+                group=whom,
+                max_bytes=self.sync_max_bytes,
+                workers=self.sync_workers)
         elif action == "sync":
             send_sync.delay(
                 self,
                 page=page,
                 group=whom,
                 page_size=self.page_size)
+        elif action == "bulk":
+            send_message(
+                self,
+                self.serialize_changes(data) or dict(action="sync", payload="ok"),
+                whom
+            )
+        elif self.batch_window:
+            batcher.add(
+                self, self.get_event_key(data), action, data, whom,
+                window=self.batch_window)
         else:
             send_message(
                 self,
@@ -70,7 +116,14 @@ class BoundWebsocketMixin(WebsocketMixin):
             except (TypeError, ValueError):
                 version = -1
 
-            if page or not version or version != binding.version:
+            changes = None
+            if not page and version > 0 and version != binding.version:
+                # clients that are a little behind only get what changed
+                changes = binding.changes_since(version)
+
+            if changes is not None:
+                binding.message("bulk", changes, whom=self.socket_id)
+            elif page or not version or version != binding.version:
                 binding.message("sync", None, page=page, whom=self.socket_id)
             else:
                 binding.message("ok", None, whom=self.socket_id)
@@ -1,18 +1,164 @@
+import base64
+import calendar
 import hashlib
+import json
 import time
+from collections import OrderedDict
 
 from django.http import HttpResponse, Http404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.http import condition
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
 from rest_framework.serializers import Serializer
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.viewsets import ModelViewSet
 
 from . import Binding
 
 
+class BindingList(object):
+    """ a lazy list of a binding's objects for pagination,
+        slicing only reads the objects in the slice
+    """
+    ordered = True
+    chunk_size = 1000
+
+    def __init__(self, binding, filters=None):
+        self.binding = binding
+        self.filters = filters or {}
+        self._keys = None
+
+    def get_keys(self):
+        """ the keys matching index filters, in page order """
+        if self._keys is None:
+            self._keys = self.binding.sort_keys(
+                self.binding.filter_keys(**self.filters))
+        return self._keys
+
+    def count(self):
+        if self.filters:
+            return len(self.get_keys())
+        return self.binding.count()
+
+    def __len__(self):
+        return self.count()
+
+    def page(self, offset, limit):
+        if limit <= 0:
+            return []
+        if self.filters:
+            keys = self.get_keys()[offset:offset + limit]
+            objects = self.binding.object_cache.get_many(keys)
+            return [objects[k] for k in keys if k in objects]
+        return list(self.binding.page(offset, limit).values())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.start or 0, index.stop, index.step
+            if start < 0 or (stop is not None and stop < 0):
+                return list(self)[index]
+            if stop is None:
+                stop = self.count()
+            return self.page(start, stop - start)[::step]
+        objects = self.page(index, 1) if index >= 0 else list(self)[index:]
+        if not objects:
+            raise IndexError(index)
+        return objects[0]
+
+    def __iter__(self):
+        offset = 0
+        while True:
+            objects = self.page(offset, self.chunk_size)
+            for obj in objects:
+                yield obj
+            if len(objects) < self.chunk_size:
+                break
+            offset += self.chunk_size
+
+
+class BindingCursorPagination(BasePagination):
+    """ forward only cursor pagination over a binding's page order,
+        the cursor remembers the last key (and its ordering score) seen
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        binding = view.get_binding()
+        offset = 0
+        cursor = self.decode_cursor(request)
+        if cursor:
+            offset = binding.offset_after(*cursor)
+
+        page_size = self.page_size or 100
+        objects = list(binding.page(offset, page_size + 1).items())
+        self.next_cursor = None
+        if len(objects) > page_size:
+            key, obj = objects[page_size - 1]
+            # as indexed, decoded objects may not score the same
+            score = binding.stored_score(key)
+            if score is None:
+                score = binding.get_score(key, obj)
+            self.next_cursor = [key, score]
+        return [obj for key, obj in objects[:page_size]]
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        cursor += "=" * (-len(cursor) % 4)
+        try:
+            key, score = json.loads(
+                base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf8"))
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+        return key, score
+
+    def encode_cursor(self, cursor):
+        return base64.urlsafe_b64encode(
+            json.dumps(cursor).encode("utf8")).decode("ascii").rstrip("=")
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_cursor)
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
+
+
 class BindingMixin(object):
     binding = None
 
+    # answer list requests with the objects exactly as stored, skipping
+    # the serializer, for bindings with a codec
+    raw_list = False
+
+    # filter list views by query params on the binding's indexed fields
+    index_filters = False
+
+    # keep rendered list responses until the binding's version changes
+    cache_list_responses = False
+    list_cache_timeout = 60 * 60
+    list_cache_key = None
+
+    # answer conditional GETs before authentication and the rest of the
+    # view, only for bindings any client may know the version of
+    early_not_modified = False
+
     def get_binding(self):
         if self.binding:
             return self.binding
@@ -21,8 +167,21 @@ class BindingMixin(object):
             return self.binding
         raise Exception("No binding found on view")
 
+    def get_index_filters(self):
+        filters = {}
+        if self.index_filters:
+            for field in self.get_binding().indexes:
+                values = self.request.query_params.getlist(field)
+                if values:
+                    filters[field] = values
+        return filters
+
     def get_queryset(self):
-        return list(self.get_binding().all().values())
+        binding = self.get_binding()
+        if not binding.count():
+            # fills the cache from the database
+            binding.all()
+        return BindingList(binding, self.get_index_filters())
 
     def conditional(self, func):
         return condition(
@@ -30,11 +189,52 @@ class BindingMixin(object):
             etag_func=self.get_etag
         )(func)
 
+    def get_metadata(self, request):
+        """ the binding's version and last modified time, read once per
+            request
+        """
+        metadata = getattr(request, "_binding_metadata", None)
+        if metadata is None:
+            metadata = request._binding_metadata = \
+                self.get_binding().metadata()
+        return metadata
+
     def last_modified_func(self, request, pk=None):
-        return self.get_binding().last_modified
+        return self.get_metadata(request)[1]
 
     def get_etag(self, request, pk=None):
-        return str(self.get_binding().version)
+        return str(self.get_metadata(request)[0])
+
+    def not_modified(self, request):
+        """ a 304 response when the client's copy is current, or None """
+        if request.method not in ("GET", "HEAD"):
+            return None
+        if not (request.META.get("HTTP_IF_NONE_MATCH") or
+                request.META.get("HTTP_IF_MODIFIED_SINCE")):
+            return None
+
+        version, last_modified = self.get_metadata(request)
+        if version is None:
+            return None
+        etag = quote_etag(str(version))
+        timestamp = None
+        if last_modified:
+            timestamp = calendar.timegm(last_modified.utctimetuple())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is not None and response.status_code == 304:
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+            return response
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.early_not_modified:
+            response = self.not_modified(request)
+            if response is not None:
+                return response
+        return super(BindingMixin, self).dispatch(request, *args, **kwargs)
 
     def get_object(self):
         try:
@@ -53,10 +253,65 @@ class BindingMixin(object):
         )(request, *args, **kwargs)
 
     def list(self, request, *args, **kwargs):
+        if self.raw_list:
+            return self.conditional(self.raw_list_response)(
+                request, *args, **kwargs)
+        if self.cache_list_responses:
+            return self.conditional(self.cached_list_response)(
+                request, *args, **kwargs)
         return self.conditional(
             super(BindingMixin, self).list
         )(request, *args, **kwargs)
 
+    def get_list_cache_key(self, request, version, last_modified=None):
+        """ versions start over when a binding is cleared, the last
+            modified time doesn't
+        """
+        serializer = self.get_serializer_class()
+        ident = "{}:{}.{}:{}:{}".format(
+            request.accepted_media_type,
+            serializer.__module__, serializer.__name__,
+            request.GET.urlencode(), last_modified
+        )
+        return "response:{}:{}".format(
+            version, hashlib.md5(ident.encode("utf8")).hexdigest())
+
+    def cached_list_response(self, request, *args, **kwargs):
+        binding = self.get_binding()
+        key = self.get_list_cache_key(request, *self.get_metadata(request))
+        cached = binding.meta_cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        # stored once rendered, see finalize_response
+        self.list_cache_key = key
+        return super(BindingMixin, self).list(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(BindingMixin, self).finalize_response(
+            request, response, *args, **kwargs)
+        if self.list_cache_key and response.status_code == 200:
+            key = self.list_cache_key
+            meta_cache = self.get_binding().meta_cache
+
+            def store(response):
+                meta_cache.set(
+                    key, (response.content, response["Content-Type"]),
+                    timeout=self.list_cache_timeout)
+
+            response.add_post_render_callback(store)
+        return response
+
+    def raw_list_response(self, request, *args, **kwargs):
+        codec = self.get_binding().object_cache.codec
+        if not codec:
+            raise Exception("raw_list needs a binding with a codec")
+        return HttpResponse(
+            codec.join(self.get_binding().all_raw().values()),
+            content_type=codec.content_type
+        )
+
 
 class BoundModelViewSet(BindingMixin, ModelViewSet):
     pass
@@ -1,4 +1,4 @@
-from .binding import Binding
+from .binding import Binding, SaveBatch, load_instances
 
 ###
 #  I've discovered that sometimes the signal handlers won't trigger
@@ -11,16 +11,57 @@ from .binding import Binding
 ###
 
 
+# process-local copies of each model's bindings,
+# dropped whenever the registry generation changes
+_bindings = {}
+
+
 def get_bindings(model):
-    return Binding.bindings.members(model.__name__ + ":") or []
+    generation = Binding.bindings.generation()
+    cached = _bindings.get(model)
+    if generation and cached and cached[0] == generation:
+        return cached[1]
+
+    bindings = list(Binding.bindings.group(model.__name__))
+    if generation:
+        _bindings[model] = (generation, bindings)
+    return bindings
 
 
 def model_saved(sender=None, instance=None, **kwargs):
-    for binding in get_bindings(sender):
-        binding.model_saved(sender=sender, instance=instance, **kwargs)
+    # bindings sharing an object cache serialize and store the instance once
+    batch = SaveBatch()
+    try:
+        for binding in get_bindings(sender):
+            binding.model_saved(
+                sender=sender, instance=instance, batch=batch, **kwargs)
+    finally:
+        # the bindings that did match are written even if another failed
+        batch.execute()
 
 
 def model_deleted(sender=None, instance=None, **kwargs):
     for binding in get_bindings(sender):
         binding.model_deleted(sender=sender, instance=instance, **kwargs)
         # print("{}:{} deleted".format(sender.__name__, instance), binding)
+
+
+def bulk_saved(model, instances):
+    """ call after bulk_create or QuerySet.update with the affected
+        instances or primary keys, signals aren't sent for those.
+        primary keys are loaded once for all the bindings
+    """
+    instances, missing = load_instances(model, instances)
+    for binding in get_bindings(model):
+        binding.models_saved(instances, missing)
+
+
+def bulk_deleted(model, instances):
+    """ call after deletes that bypass signals with the removed
+        instances or primary keys
+    """
+    instances = list(instances)
+    pks = [i for i in instances if not isinstance(i, model)]
+    instances = [i for i in instances if isinstance(i, model)]
+    for binding in get_bindings(model):
+        binding.models_deleted(instances + binding.get_pk_keys(pks))
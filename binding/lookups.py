@@ -0,0 +1,176 @@
+""" compiles filters, excludes and Q objects into python predicates that
+    mirror the ORM, so saved instances can be matched without a query
+"""
+import operator
+
+import six
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Model, Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import QuerySet
+
+
+class Unsupported(Exception):
+    """ the lookup can't be evaluated in python """
+
+
+def _compare(op):
+    def test(a, b):
+        return a is not None and op(a, b)
+    return test
+
+
+def _text(op, fold=False):
+    def test(a, b):
+        if a is None:
+            return False
+        a, b = six.text_type(a), six.text_type(b)
+        if fold:
+            a, b = a.lower(), b.lower()
+        return op(a, b)
+    return test
+
+
+LOOKUPS = {
+    "exact": lambda a, b: a is None if b is None else a == b,
+    "iexact": lambda a, b: a is None if b is None else (
+        a is not None and six.text_type(a).lower() == six.text_type(b).lower()),
+    "in": lambda a, b: a in b,
+    "gt": _compare(operator.gt),
+    "gte": _compare(operator.ge),
+    "lt": _compare(operator.lt),
+    "lte": _compare(operator.le),
+    "isnull": lambda a, b: (a is None) == bool(b),
+    "range": lambda a, b: a is not None and b[0] <= a <= b[1],
+    "contains": _text(operator.contains),
+    "icontains": _text(operator.contains, True),
+    "startswith": _text(lambda a, b: a.startswith(b)),
+    "istartswith": _text(lambda a, b: a.startswith(b), True),
+    "endswith": _text(lambda a, b: a.endswith(b)),
+    "iendswith": _text(lambda a, b: a.endswith(b), True),
+}
+
+# lookups whose value is prepared like a field value
+PREPARED = ("exact", "gt", "gte", "lt", "lte")
+
+
+def resolve_path(model, parts):
+    """ the attribute names to follow from an instance and the final field """
+    attrs = []
+    field = None
+    for index, name in enumerate(parts):
+        last = index == len(parts) - 1
+        if name == "pk":
+            name = model._meta.pk.name
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise Unsupported(name)
+        if field.many_to_many or field.one_to_many or not field.concrete:
+            raise Unsupported(name)
+
+        if not field.is_relation:
+            if not last:
+                # transforms like date__year
+                raise Unsupported(name)
+            attrs.append(field.attname)
+        elif last:
+            attrs.append(field.attname)
+        elif parts[index + 1] in ("pk", field.target_field.name) and \
+                index + 1 == len(parts) - 1:
+            # related_id without loading the related object
+            attrs.append(field.attname)
+            return attrs, field
+        else:
+            attrs.append(field.name)
+            model = field.related_model
+    return attrs, field
+
+
+def prepare(field, value):
+    if isinstance(value, Model):
+        return value.pk
+    if value is None:
+        return None
+    if field.is_relation:
+        field = field.target_field
+    try:
+        return field.to_python(value)
+    except ValidationError:
+        raise Unsupported(value)
+
+
+def compile_lookup(model, path, value):
+    parts = path.split(LOOKUP_SEP)
+    lookup = "exact"
+    if len(parts) > 1 and parts[-1] in LOOKUPS:
+        lookup = parts.pop()
+
+    if isinstance(value, QuerySet) or hasattr(value, "resolve_expression"):
+        raise Unsupported(path)
+
+    attrs, field = resolve_path(model, parts)
+    if lookup in PREPARED:
+        value = prepare(field, value)
+    elif lookup in ("in", "range"):
+        value = [prepare(field, v) for v in value]
+        if lookup == "in":
+            value = set(value)
+    test = LOOKUPS[lookup]
+
+    def predicate(instance):
+        for attr in attrs:
+            if instance is None:
+                break
+            instance = getattr(instance, attr)
+        return test(instance, value)
+    return predicate
+
+
+def compile_q(model, q):
+    children = []
+    for child in q.children:
+        if isinstance(child, Q):
+            children.append(compile_q(model, child))
+        else:
+            children.append(compile_lookup(model, *child))
+    combine = any if q.connector == Q.OR else all
+    negated = q.negated
+
+    def predicate(instance):
+        result = combine(c(instance) for c in children)
+        return not result if negated else result
+    return predicate
+
+
+def compile_predicate(model, filters=None, excludes=None, q=()):
+    """ a function telling whether an instance would be in
+        `model.objects.filter(*q, **filters).exclude(**excludes)`,
+        raises Unsupported when that can't be answered in python
+    """
+    included = compile_q(model, Q(*q, **(filters or {})))
+    if not excludes:
+        return included
+    excluded = compile_q(model, Q(**excludes))
+
+    def predicate(instance):
+        return included(instance) and not excluded(instance)
+    return predicate
+
+
+def signature(value):
+    """ a comparable description of filter arguments that never evaluates
+        querysets, used to notice when they change
+    """
+    if isinstance(value, dict):
+        return tuple(sorted(
+            (key, signature(v)) for key, v in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return (type(value).__name__,) + tuple(signature(v) for v in value)
+    if isinstance(value, Q):
+        return (
+            "Q", value.connector, value.negated,
+            signature(list(value.children)))
+    if isinstance(value, QuerySet):
+        return ("QuerySet", id(value))
+    return repr(value)
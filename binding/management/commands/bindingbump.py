@@ -6,7 +6,7 @@ class Command(BaseCommand):
     help = 'Resets all the bindings and send out new versions'
 
     def handle(self, *args, **options):
-        for binding in Binding.bindings.members():
+        for binding in Binding.bindings.iter_members():
             self.stdout.write(" - {}".format(binding.name))
             binding.bump()
         self.stdout.write(self.style.NOTICE('done.'))
@@ -6,6 +6,6 @@ class Command(BaseCommand):
     help = 'Lists all the bindings in use on this system'
 
     def handle(self, *args, **options):
-        for binding in Binding.bindings.pattern("*"):
+        for binding in Binding.bindings.iter_members():
             self.stdout.write(" - {}".format(binding.name))
         self.stdout.write(self.style.NOTICE('done.'))
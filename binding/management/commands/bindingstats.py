@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from ... import metrics
+
+
+class Command(BaseCommand):
+    help = 'Shows the operation metrics collected for each binding'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--binding", help="only show the metrics of this binding")
+        parser.add_argument(
+            "--reset", action="store_true",
+            help="clear the stored metrics after showing them")
+
+    def handle(self, *args, **options):
+        exporter = metrics.RedisExporter()
+        metrics.flush()
+        stats = exporter.read()
+        if options["binding"]:
+            stats = dict(
+                (name, operations) for name, operations in stats.items()
+                if name == options["binding"])
+
+        for name in sorted(stats):
+            self.stdout.write(" - {}".format(name))
+            for operation, counter in sorted(stats[name].items()):
+                self.stdout.write("   " + self.describe(operation, counter))
+            hits = sum(c.get("hits", 0) for c in stats[name].values())
+            misses = sum(c.get("misses", 0) for c in stats[name].values())
+            if hits + misses:
+                self.stdout.write("   cache hit ratio {:.1%}".format(
+                    hits / (hits + misses)))
+
+        if options["reset"]:
+            exporter.clear()
+        self.stdout.write(self.style.NOTICE('done.'))
+
+    def describe(self, operation, counter):
+        calls = counter.get("calls", 0)
+        if not calls:
+            return "{}: {:.0f} hits, {:.0f} misses".format(
+                operation, counter.get("hits", 0), counter.get("misses", 0))
+        return (
+            "{}: {:.0f} calls, {:.2f}ms avg, p95 <= {}ms, "
+            "{:.1f} commands, {:.0f} bytes sent, {:.0f} received per call"
+        ).format(
+            operation, calls, counter.get("seconds", 0) * 1000 / calls,
+            self.percentile(counter, 0.95),
+            counter.get("commands", 0) / calls,
+            counter.get("bytes_sent", 0) / calls,
+            counter.get("bytes_received", 0) / calls,
+        )
+
+    def percentile(self, counter, fraction):
+        """ the upper bound of the histogram bucket holding `fraction` """
+        total = 0
+        calls = counter.get("calls", 0)
+        for bound in metrics.BUCKETS + ("inf",):
+            total += counter.get("le:{}".format(bound), 0)
+            if total >= calls * fraction:
+                return bound
+        return "inf"
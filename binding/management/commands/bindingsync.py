@@ -1,3 +1,5 @@
+import time
+
 from django.core.management.base import BaseCommand, CommandError
 from ...binding import Binding
 
@@ -5,8 +7,36 @@ from ...binding import Binding
 class Command(BaseCommand):
     help = 'Resets all the bindings and send out new versions'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000,
+            help="rows checked against the cache per round trip")
+        parser.add_argument(
+            "--progress", action="store_true",
+            help="report progress and throughput after every chunk")
+        parser.add_argument(
+            "--rebuild-indexes", action="store_true",
+            help="rebuild the page order and field indexes afterwards")
+
     def handle(self, *args, **options):
-        for binding in Binding.bindings.members():
+        for binding in Binding.bindings.iter_members():
             self.stdout.write(" - {}".format(binding.name))
-            binding.refresh()
+            start = time.time()
+            progress = None
+            if options["progress"]:
+                progress = self.progress(start)
+            added, removed = binding.refresh(
+                chunk_size=options["chunk_size"], progress=progress)
+            self.stdout.write("   {} added, {} removed in {:.2f}s".format(
+                added, removed, time.time() - start))
+            if options["rebuild_indexes"]:
+                binding.rebuild_indexes(chunk_size=options["chunk_size"])
         self.stdout.write(self.style.NOTICE('done.'))
+
+    def progress(self, start):
+        def report(checked, added, removed):
+            rate = checked / max(time.time() - start, 0.001)
+            self.stdout.write(
+                "   {} rows checked ({:.0f}/s), {} added, {} removed".format(
+                    checked, rate, added, removed))
+        return report
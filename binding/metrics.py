@@ -0,0 +1,272 @@
+""" per binding operation metrics: calls, redis commands, bytes, latency
+    and cache hits. off unless enabled, either with BINDING_METRICS = True
+    in the settings or by calling enable(). while off, an instrumented
+    method costs one attribute check
+
+    counters are kept in process and flushed every `interval` seconds to
+    each of the `exporters`, callables receiving
+    {binding: {operation: {counter: value}}}. the default exporter adds
+    them to redis hashes, read by the bindingstats command
+"""
+import functools
+import threading
+import time
+
+from django_redis import get_redis_connection
+
+# upper bounds of the latency histogram, in milliseconds
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+STATS_PREFIX = "binding:stats"
+
+enabled = False
+interval = 10
+exporters = []
+
+_lock = threading.Lock()
+_local = threading.local()
+_counters = {}
+_flushed = [time.time()]
+_installed = []
+
+
+def enable(flush_interval=None):
+    global enabled, interval
+    if flush_interval is not None:
+        interval = flush_interval
+    _install()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+    _uninstall()
+
+
+def _counter(name, operation):
+    key = (name, operation)
+    counter = _counters.get(key)
+    if counter is None:
+        counter = _counters.setdefault(key, dict(
+            calls=0, commands=0, bytes_sent=0, bytes_received=0,
+            seconds=0.0, hits=0, misses=0,
+            buckets=[0] * (len(BUCKETS) + 1),
+        ))
+    return counter
+
+
+def _current():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def count(name, counter, amount=1):
+    """ adds to a counter of the operation running for a binding """
+    if not enabled:
+        return
+    current = _current()
+    operation = current[1] if current and current[0] == name else "-"
+    with _lock:
+        _counter(name, operation)[counter] += amount
+
+
+def instrument(operation):
+    """ times a method of a binding or a cache, redis commands sent
+        while it runs are added to it
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            if not enabled:
+                return function(self, *args, **kwargs)
+
+            # cache calls are counted under the binding using them
+            current = _current()
+            name = getattr(self, "name", None) or (
+                current[0] if current else getattr(self, "prefix", "-"))
+            stack = getattr(_local, "stack", None)
+            if stack is None:
+                stack = _local.stack = []
+            stack.append((name, operation))
+            start = time.time()
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                stack.pop()
+                _record(name, operation, elapsed)
+        return wrapper
+    return decorator
+
+
+def _record(name, operation, elapsed):
+    milliseconds = elapsed * 1000
+    bucket = len(BUCKETS)
+    for index, bound in enumerate(BUCKETS):
+        if milliseconds <= bound:
+            bucket = index
+            break
+    with _lock:
+        counter = _counter(name, operation)
+        counter["calls"] += 1
+        counter["seconds"] += elapsed
+        counter["buckets"][bucket] += 1
+    if time.time() - _flushed[0] > interval:
+        flush()
+
+
+def _size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, memoryview):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_size(v) for v in value)
+    return 0
+
+
+def _add(counter, amount):
+    current = enabled and _current()
+    if current and amount:
+        with _lock:
+            _counter(*current)[counter] += amount
+
+
+def _install():
+    """ counts commands and bytes at the connection level while enabled,
+        undone by _uninstall
+    """
+    if _installed:
+        return
+    from redis import connection
+    cls = getattr(connection, "AbstractConnection", connection.Connection)
+    send_command = cls.send_command
+    pack_commands = cls.pack_commands
+    send_packed_command = cls.send_packed_command
+    read_response = cls.read_response
+
+    def counting_command(self, *args, **kwargs):
+        _add("commands", 1)
+        return send_command(self, *args, **kwargs)
+
+    def counting_pack(self, commands):
+        # a pipeline's commands are packed together and sent at once
+        commands = list(commands)
+        _add("commands", len(commands))
+        return pack_commands(self, commands)
+
+    def counting_send(self, command, *args, **kwargs):
+        _add("bytes_sent", _size(command))
+        return send_packed_command(self, command, *args, **kwargs)
+
+    def counting_read(self, *args, **kwargs):
+        response = read_response(self, *args, **kwargs)
+        _add("bytes_received", _size(response))
+        return response
+
+    patches = dict(
+        send_command=counting_command,
+        pack_commands=counting_pack,
+        send_packed_command=counting_send,
+        read_response=counting_read,
+    )
+    for name, patch in patches.items():
+        _installed.append((cls, name, cls.__dict__.get(name)))
+        setattr(cls, name, patch)
+
+
+def _uninstall():
+    """ puts back the connection methods replaced by _install """
+    while _installed:
+        cls, name, original = _installed.pop()
+        if original is None:
+            delattr(cls, name)
+        else:
+            setattr(cls, name, original)
+
+
+def snapshot(reset=False):
+    """ the counters as {binding: {operation: {counter: value}}} """
+    with _lock:
+        stats = {}
+        for (name, operation), counter in _counters.items():
+            counter = dict(counter, buckets=list(counter["buckets"]))
+            stats.setdefault(name, {})[operation] = counter
+        if reset:
+            _counters.clear()
+    return stats
+
+
+def flush():
+    """ hands the counters collected since the last flush to the exporters """
+    _flushed[0] = time.time()
+    stats = snapshot(reset=True)
+    if not stats:
+        return stats
+    # the exporters' own commands aren't counted
+    stack, _local.stack = getattr(_local, "stack", None), []
+    try:
+        for exporter in exporters:
+            exporter(stats)
+    finally:
+        _local.stack = stack
+    return stats
+
+
+class RedisExporter(object):
+    """ adds the counters to one hash per binding and operation """
+
+    def __init__(self, cache_name="default", prefix=STATS_PREFIX):
+        self.cache_name = cache_name
+        self.prefix = prefix
+
+    def get_key(self, name, operation):
+        return "{}:{}:{}".format(self.prefix, name, operation)
+
+    def get_pattern(self):
+        from .binding import escape_glob
+        return escape_glob(self.prefix) + ":*"
+
+    def __call__(self, stats):
+        con = get_redis_connection(self.cache_name)
+        pipe = con.pipeline(transaction=False)
+        for name, operations in stats.items():
+            for operation, counter in operations.items():
+                key = self.get_key(name, operation)
+                for field, value in counter.items():
+                    if field == "buckets":
+                        for bound, hits in zip(BUCKETS + ("inf",), value):
+                            if hits:
+                                pipe.hincrby(key, "le:{}".format(bound), hits)
+                    elif isinstance(value, float):
+                        pipe.hincrbyfloat(key, field, value)
+                    elif value:
+                        pipe.hincrby(key, field, value)
+        pipe.execute()
+
+    def read(self):
+        """ the stored counters, in the same shape as snapshot() """
+        con = get_redis_connection(self.cache_name)
+        keys = sorted(
+            key.decode("utf8")
+            for key in con.scan_iter(self.get_pattern(), count=1000))
+        pipe = con.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        stats = {}
+        for key, values in zip(keys, pipe.execute()):
+            name, operation = key[len(self.prefix) + 1:].rsplit(":", 1)
+            stats.setdefault(name, {})[operation] = dict(
+                (field.decode("utf8"), float(value))
+                for field, value in values.items()
+            )
+        return stats
+
+    def clear(self):
+        con = get_redis_connection(self.cache_name)
+        keys = list(con.scan_iter(self.get_pattern(), count=1000))
+        if keys:
+            con.delete(*keys)
+
+
+exporters.append(RedisExporter())
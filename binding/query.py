@@ -0,0 +1,25 @@
+from django.db import models
+
+from .listeners import bulk_saved
+
+
+class BindingQuerySetMixin(object):
+    """ sends bulk operations that skip signals on to the bindings """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super(BindingQuerySetMixin, self).bulk_create(
+            objs, *args, **kwargs)
+        # databases that don't return primary keys can't be tracked
+        bulk_saved(self.model, [o for o in objs if o.pk is not None])
+        return objs
+
+    def update(self, **kwargs):
+        pks = list(self.values_list("pk", flat=True))
+        rows = super(BindingQuerySetMixin, self).update(**kwargs)
+        if pks:
+            bulk_saved(self.model, pks)
+        return rows
+
+
+class BindingQuerySet(BindingQuerySetMixin, models.QuerySet):
+    pass
@@ -1,13 +1,24 @@
+import atexit
 import logging
 import math
 import socket
+import threading
 import time
+import uuid
+from collections import OrderedDict
+from concurrent import futures
 
 from celery import shared_task
+from django.apps import apps
 from django.core.cache import cache
+from django.db import models
+from django_redis import get_redis_connection
+
+from .codecs import JSONCodec, instance_to_dict
 from .listeners import get_bindings
 
 debug = logging.getLogger("debug")
+json_codec = JSONCodec()
 
 
 def debounce_key(*args, **kwargs):
@@ -42,11 +53,135 @@ def model_saved_key(sender, instance_id, **kwargs):
     return "{}:{}".format(sender.__name__, instance_id)
 
 
-@debounce(timeout=0.5, key=model_saved_key)
+# moves up to ARGV[1] primary keys from the dirty set to the processing
+# set, they're removed from there once applied
+TAKE_SCRIPT = """
+local pks = redis.call('SPOP', KEYS[1], ARGV[1])
+if #pks > 0 then
+    redis.call('SADD', KEYS[2], unpack(pks))
+end
+return pks
+"""
+
+# deletes a lock only while it still holds our token
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# unpack() in TAKE_SCRIPT is bound by lua's C stack
+MAX_TAKE = 7999
+
+
+class Coalescer(object):
+    """ collects changed primary keys per model in redis and applies them
+        to the bindings in bulk. a burst of saves schedules one flush task
+        per `timeout` window (or per `max_size` keys) instead of one task
+        per save. one flush runs per model at a time, under a lock that
+        expires after `lock_timeout` seconds without progress
+    """
+
+    def __init__(self, timeout=0.5, max_size=1000, cache_name="default",
+                 lock_timeout=60):
+        if not 0 < max_size <= MAX_TAKE:
+            raise ValueError(
+                "max_size must be between 1 and {}".format(MAX_TAKE))
+        self.timeout = timeout
+        self.max_size = max_size
+        self.cache_name = cache_name
+        self.lock_timeout = lock_timeout
+
+    def get_key(self, label, *parts):
+        # a model's keys share a hash slot for TAKE_SCRIPT
+        return ":".join(("binding:dirty", "{" + label + "}") + parts)
+
+    def add(self, sender, *pks):
+        label = sender._meta.label
+        con = get_redis_connection(self.cache_name)
+        pipe = con.pipeline(transaction=False)
+        pipe.sadd(self.get_key(label), *pks)
+        pipe.scard(self.get_key(label))
+        # the marker outlives the window in case the flush never runs
+        pipe.set(
+            self.get_key(label, "scheduled"), 1, nx=True,
+            px=int((self.timeout + 60) * 1000))
+        added, size, scheduled = pipe.execute()
+        if scheduled:
+            self.schedule(label, self.timeout)
+        elif size >= self.max_size and con.set(
+                self.get_key(label, "full"), 1, nx=True,
+                px=int((self.timeout + 60) * 1000)):
+            self.schedule(label, 0)
+
+    def schedule(self, label, countdown):
+        flush_model.apply_async((label,), countdown=countdown)
+
+    def flush(self, label):
+        """ applies every pending change for a model, returns the count.
+            keys being applied wait in a processing set, a flush that
+            fails leaves them to the next one. while another flush holds
+            the model's lock this one is put off by `timeout`
+        """
+        con = get_redis_connection(self.cache_name)
+        lock = self.get_key(label, "lock")
+        token = str(uuid.uuid4())
+        if not con.set(lock, token, nx=True, ex=self.lock_timeout):
+            self.schedule(label, self.timeout)
+            return 0
+        try:
+            return self._flush(con, label, lock)
+        finally:
+            con.register_script(RELEASE_SCRIPT)(keys=[lock], args=[token])
+
+    def _flush(self, con, label, lock):
+        model = apps.get_model(label)
+        dirty = self.get_key(label)
+        processing = self.get_key(label, "processing")
+        pipe = con.pipeline()
+        # saves from here on schedule another flush
+        pipe.delete(self.get_key(label, "scheduled"), self.get_key(label, "full"))
+        # picks up what a failed flush left behind, nothing else can be
+        # applying them while we hold the lock
+        pipe.sunionstore(dirty, [dirty, processing])
+        pipe.delete(processing)
+        pipe.execute()
+
+        take = con.register_script(TAKE_SCRIPT)
+        flushed = 0
+        while True:
+            pks = take(keys=[dirty, processing], args=[self.max_size])
+            if not pks:
+                break
+            pks = [pk.decode("utf8") for pk in pks]
+            instances = model.objects.in_bulk(pks)
+            found = set(str(pk) for pk in instances)
+            missing = [pk for pk in pks if pk not in found]
+            for binding in get_bindings(model):
+                binding.models_saved(list(instances.values()), missing)
+            pipe = con.pipeline()
+            pipe.srem(processing, *pks)
+            pipe.expire(lock, self.lock_timeout)
+            pipe.execute()
+            flushed += len(pks)
+        return flushed
+
+
+coalescer = Coalescer()
+
+
+@shared_task(name="binding.flush_model")
+def flush_model(label):
+    return coalescer.flush(label)
+
+
+@shared_task(name="model_saved")
 def model_saved(sender, instance_id):
-    instance = sender.objects.get(id=instance_id)
-    for binding in get_bindings(sender):
-        binding.model_saved(sender=sender, instance=instance)
+    """ marks an instance as changed, the bindings see it with the
+        rest of the burst on the next flush
+    """
+    coalescer.add(sender, instance_id)
 
 
 def send_sync_key(binding, group=None, **kwargs):
@@ -58,13 +193,12 @@ def send_sync_key(binding, group=None, **kwargs):
 def send_sync(binding, group=None, page=1, page_size=100):
     if not page:
         page = 1
-    keys = binding.keys()
-    count = len(keys)
+    count = binding.count()
     pages = int(math.ceil(count / float(page_size)))
     page = page - 1
     debug.info("sending page: {}/{}".format(page + 1, pages))
     if page < pages:
-        page_keys = keys[page * page_size: (page + 1) * page_size]
+        page_keys = binding.page_keys(page * page_size, page_size)
         page_objects = binding.object_cache.get_many(page_keys)
 
         try:
@@ -72,7 +206,7 @@ def send_sync(binding, group=None, page=1, page_size=100):
                 binding,
                 dict(
                     action="sync",
-                    payload=page_objects.values(),
+                    payload=list(page_objects.values()),
                     page=page + 1,
                     pages=pages
                 ),
@@ -85,18 +219,7 @@ def send_sync(binding, group=None, page=1, page_size=100):
 
         # fix missing objects
         # in case the cache is damaged
-        for key in page_keys:
-            if key not in page_objects:
-                debug.error("key missing %s", key)
-                try:
-                    obj = binding.model.objects.get(pk=key)
-                    if binding.model_matches(obj):
-                        binding.save_instance(obj, False)
-                    else:
-                        binding.delete_instance(obj)
-                except binding.model.DoesNotExist:
-                    obj = binding.model(pk=key)
-                    binding.delete_instance(obj)
+        repair(binding, [key for key in page_keys if key not in page_objects])
 
     else:
         send_message(
@@ -110,18 +233,178 @@ def send_sync(binding, group=None, page=1, page_size=100):
         )
 
 
+def repair(binding, keys):
+    """ brings member keys whose object is missing from the cache back
+        in line with the database
+    """
+    for key in keys:
+        debug.error("key missing %s", key)
+        try:
+            obj = binding.model.objects.get(pk=key)
+            if binding.model_matches(obj):
+                binding.save_instance(obj, False)
+            else:
+                binding.delete_instance(obj)
+        except binding.model.DoesNotExist:
+            obj = binding.model(pk=key)
+            binding.delete_instance(obj)
+
+
+def json_size(value):
+    """ the length of an object encoded as json, instances by their fields """
+    if isinstance(value, models.Model):
+        value = instance_to_dict(value)
+    return len(json_codec.encode(value))
+
+
+def split_pages(items, max_bytes, max_objects=None, size=len):
+    """ groups (key, value) into pages of up to `max_bytes`, measured by
+        `size(value)`. a larger object gets a page of its own
+    """
+    page, total = [], 0
+    for key, value in items:
+        length = size(value)
+        if page and (total + length > max_bytes or
+                     (max_objects and len(page) >= max_objects)):
+            yield page
+            page, total = [], 0
+        page.append((key, value))
+        total += length
+    if page:
+        yield page
+
+
+def send_page(binding, number, page, group=None, decode=None):
+    send_message(
+        binding,
+        dict(
+            action="sync",
+            payload=[decode(value) if decode else value
+                     for key, value in page],
+            page=number
+        ),
+        group=group
+    )
+
+
+@shared_task()
+def stream_sync(binding, group=None, max_bytes=256 * 1024, max_objects=None,
+                workers=4, chunk_size=1000):
+    """ sends the whole binding in pages of up to `max_bytes` encoded bytes,
+        `workers` pages at a time. pages can arrive out of order, each has
+        its number and the closing "ok" has the page count
+    """
+    missing = []
+    codec = binding.object_cache.codec
+    if codec:
+        # the stored bytes are the codec's output already
+        decode, size = codec.decode, len
+    else:
+        # stored pickles are compressed, objects are measured as json
+        decode, size = None, json_size
+
+    def present():
+        for key, raw in binding.iter_raw(chunk_size):
+            if raw is None:
+                missing.append(key)
+            elif codec:
+                yield key, raw
+            else:
+                yield key, binding.object_cache.decode(raw)
+
+    pages = 0
+    pending = set()
+    with futures.ThreadPoolExecutor(workers) as pool:
+        for page in split_pages(present(), max_bytes, max_objects, size):
+            pages += 1
+            # only a few pages are held in memory at once
+            if len(pending) >= workers * 2:
+                done, pending = futures.wait(
+                    pending, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(pool.submit(
+                send_page, binding, pages, page, group, decode))
+        for future in futures.as_completed(pending):
+            future.result()
+
+    send_message(
+        binding,
+        dict(action="sync", payload="ok", pages=pages),
+        group=group
+    )
+    repair(binding, missing)
+    return pages
+
+
+class EventBatcher(object):
+    """ holds change events per binding and group for a short window and
+        sends them as one packet. a later event for a key replaces the
+        earlier one, an update to a key created in the window stays a
+        create with the update's data and a delete cancels it. events are
+        serialized by the binding's serialize_message when they're sent
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def add(self, binding, key, action, data, group=None, window=0.01):
+        # names are only unique per model
+        ident = (binding.bindings_key, group)
+        with self.lock:
+            entry = self.pending.get(ident)
+            if entry is None:
+                entry = self.pending[ident] = (binding, OrderedDict())
+                timer = threading.Timer(window, self.flush, (ident,))
+                timer.daemon = True
+                timer.start()
+            events = entry[1]
+            previous = events.pop(key, None)
+            if previous is not None and previous[0] == "create":
+                if action == "delete":
+                    return
+                action = "create"
+            events[key] = (action, data)
+
+    def flush(self, ident):
+        with self.lock:
+            entry = self.pending.pop(ident, None)
+        if entry and entry[1]:
+            binding = entry[0]
+            send_message(binding, [
+                dict(action=action,
+                     payload=binding.serialize_message(action, data))
+                for action, data in entry[1].values()
+            ], ident[1])
+
+    def flush_all(self):
+        for ident in list(self.pending):
+            self.flush(ident)
+
+
+batcher = EventBatcher()
+# events still in their window when the process exits are sent
+atexit.register(batcher.flush_all)
+
+
 def send_message(binding, packet, group=None):
     # this should only be run if DNW is installed
+    # packet can be a single event or a list of them
 
     if not group:
         group = binding.get_user_group()
 
+    if not isinstance(packet, list):
+        packet = [packet]
+
+    version, last_modified = binding.metadata()
     data = {
-        "events": [packet],
+        "events": packet,
         "server": socket.gethostname(),
         "binding": binding.name,
-        "version": binding.version,
-        "last-modified": str(binding.last_modified),
+        "version": version,
+        "last-modified": str(last_modified),
     }
 
     # from websockets.utils import get_emitter
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.test import TestCase
+from redis.asyncio.connection import SSLConnection
+
+from binding_test.models import Product
+
+from ..aio import AsyncBindingMixin, get_connection
+from ._binding import TestBinding
+
+
+class AsyncBinding(AsyncBindingMixin, TestBinding):
+    indexes = ("venue",)
+    ordered = True
+    changelog_size = 10
+
+
+class AsyncBindingTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.t1 = Product.objects.create(name="t1", venue="store")
+        self.t2 = Product.objects.create(name="t2", venue="website")
+        self.binding = AsyncBinding()
+        self.binding.clearMessages()
+
+    async def testReads(self):
+        objects = await self.binding.aall()
+        self.assertEqual(sorted(objects.keys()), ["1", "2"])
+        self.assertEqual(objects["1"].name, "t1")
+        self.assertEqual(len(await self.binding.akeys()), 2)
+        self.assertEqual(await self.binding.acount(), 2)
+        self.assertEqual(
+            await self.binding.aversion, self.binding.current_version())
+        self.assertEqual(
+            await self.binding.alast_modified(), self.binding.last_modified)
+        self.assertEqual(
+            await self.binding.ametadata(), self.binding.metadata())
+
+    async def testWrites(self):
+        version = await self.binding.acurrent_version()
+        self.t1.venue = "website"
+        self.assertEqual(
+            await self.binding.asave_instance(self.t1, False), version + 1)
+        self.assertEqual(self.binding.outbox, [("update", self.t1)])
+        # the synchronous side sees the same keys
+        self.assertEqual(self.binding.all()["1"].venue, "website")
+        self.assertEqual(
+            sorted(self.binding.filter(venue="website").keys()), ["1", "2"])
+        self.assertEqual(self.binding.changes_since(version)["update"].keys(),
+                         set(["1"]))
+
+        self.assertEqual(
+            await self.binding.adelete_instance(self.t2), version + 2)
+        self.assertIsNone(await self.binding.adelete_instance(self.t2))
+        self.assertEqual(list(self.binding.all().keys()), ["1"])
+        self.assertEqual(list(self.binding.filter(venue="website")), ["1"])
+        self.assertEqual(self.binding.sorted_keys(), ["1"])
+
+        self.assertEqual(await self.binding.abump(), version + 3)
+        self.assertEqual(await self.binding.aversion, version + 3)
+
+
+class ConnectionTestCase(TestCase):
+
+    async def testOptions(self):
+        options = dict(
+            PASSWORD="secret",
+            SOCKET_TIMEOUT=2,
+            CONNECTION_POOL_KWARGS=dict(
+                max_connections=7, ssl_cert_reqs="none"),
+        )
+        caches = dict(options=dict(
+            BACKEND="django_redis.cache.RedisCache",
+            LOCATION="rediss://redis.example.com:6380/3",
+            OPTIONS=options,
+        ))
+        with self.settings(CACHES=caches):
+            pool = get_connection("options").connection_pool
+        self.assertIs(pool.connection_class, SSLConnection)
+        self.assertEqual(pool.max_connections, 7)
+        self.assertEqual(pool.connection_kwargs["password"], "secret")
+        self.assertEqual(pool.connection_kwargs["socket_timeout"], 2)
+        self.assertEqual(pool.connection_kwargs["db"], 3)
+
+    async def testSentinel(self):
+        caches = dict(sentinel=dict(
+            BACKEND="django_redis.cache.RedisCache",
+            LOCATION="redis://primary/2",
+            OPTIONS=dict(
+                SENTINELS=[("sentinel.example.com", 26379)],
+                CONNECTION_FACTORY="django_redis.pool.SentinelConnectionFactory",
+            ),
+        ))
+        with self.settings(CACHES=caches):
+            pool = get_connection("sentinel").connection_pool
+        self.assertEqual(pool.service_name, "primary")
+        self.assertEqual(pool.connection_kwargs["db"], 2)
@@ -22,3 +22,7 @@ class TestBinding(Binding):
     # not an override
     def clearMessages(self):
         del self.outbox[:]
+
+
+class JSONBinding(TestBinding):
+    codec = "json"
@@ -0,0 +1,5 @@
+# the asyncio tests use python 3 syntax, python 2 doesn't load them
+import sys
+
+if sys.version_info >= (3, 7):
+    from ._aio_cases import *  # noqa
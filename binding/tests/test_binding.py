@@ -1,13 +1,23 @@
+import json
 import sys
 import time
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
 
-from binding_test.models import Product
+from binding_test.models import Product, Review
 
-from ..binding import CacheArray, CacheDict
-from ._binding import TestBinding
+from ..binding import (
+    CacheArray, CacheDict, HashCacheDict, LocalCache, escape_glob)
+from ..codecs import msgpack
+from ..listeners import get_bindings
+from ._binding import JSONBinding, TestBinding
 
 
 class CacheDictTestCase(TestCase):
@@ -44,6 +54,161 @@ class CacheDictTestCase(TestCase):
         print("cache C:", time.time() - start)
 
 
+class ScanTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.objects = CacheDict("scan")
+        self.objects.set_many(dict((x, x) for x in range(25)))
+        cache.set("other:1", 1)
+
+    def testScanKeys(self):
+        self.assertEqual(
+            sorted(self.objects.scan_keys("1*", count=5)),
+            sorted(str(x) for x in range(25) if str(x).startswith("1")))
+
+    def testIterPattern(self):
+        values = self.objects.iter_pattern("*", chunk_size=4)
+        self.assertEqual(sorted(values), list(range(25)))
+        self.assertEqual(sorted(self.objects.pattern("2?")), [20, 21, 22, 23, 24])
+
+    def testGlobPrefix(self):
+        # a prefix with glob characters only matches itself
+        globbed = CacheDict("s[ac]*n?")
+        globbed.set("1", 1)
+        others = HashCacheDict("h*")
+        others.set("1", 1)
+        hashed = HashCacheDict("h")
+        hashed.set("2", 2)
+
+        self.assertEqual(list(globbed.scan_keys()), ["1"])
+        self.assertEqual(list(others.scan_keys()), ["1"])
+        globbed.clear()
+        self.assertEqual(len(list(self.objects.scan_keys())), 25)
+        self.assertEqual(list(hashed.scan_keys()), ["2"])
+        self.assertEqual(escape_glob("a*b?[c]\\"), "a\\*b\\?\\[c\\]\\\\")
+
+
+class HashCacheDictTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.objects = HashCacheDict("hashed", bucket_size=10)
+
+    def testBuckets(self):
+        self.objects.set_many(dict((x, x * 2) for x in range(25)))
+        self.objects.set("a", "b")
+        self.assertEqual(self.objects.get_bucket_key(12), "hashed:b:1")
+        self.assertEqual(
+            cache.client.get_client().hlen(self.objects.get_bucket_key(12)), 10)
+        self.assertEqual(self.objects.get("12"), 24)
+        self.assertEqual(self.objects.get("a"), "b")
+        self.assertIsNone(self.objects.get("99"))
+        self.assertEqual(
+            self.objects.get_many(["1", "24", "99"]), {"1": 2, "24": 48})
+        self.assertEqual(sorted(self.objects.pattern("2?")), [40, 42, 44, 46, 48])
+        self.assertEqual(len(list(self.objects.scan_keys())), 26)
+
+        # whole buckets, only the names asked for
+        self.assertEqual(
+            self.objects.get_all(["1", "12", "a", "99"]),
+            {"1": 2, "12": 24, "a": "b"})
+        # sparse buckets by name, dense ones whole
+        names = [str(x) for x in range(10, 16)] + ["1"]
+        with mock.patch.object(
+                self.objects, "get_many", wraps=self.objects.get_many) as get:
+            values = self.objects.get_all(names)
+        get.assert_called_once_with(["1"])
+        self.assertEqual(values, dict((n, int(n) * 2) for n in names))
+
+        self.objects.clear()
+        self.assertEqual(self.objects.get_many(["1", "a"]), {})
+
+    def testTimeout(self):
+        con = cache.client.get_client()
+        bucket = self.objects.get_bucket_key(1)
+        objects = HashCacheDict("hashed", bucket_size=10, timeout=100)
+        objects.set("1", 1)
+        con.expire(bucket, 50)
+        # a later write doesn't push the expiry back
+        objects.set("2", 2)
+        self.assertLessEqual(con.ttl(bucket), 50)
+
+        objects.expire("1", 10)
+        self.assertLessEqual(con.ttl(bucket), 10)
+        objects.expire("1")
+        self.assertEqual(objects.get_many(["1", "2"]), {"2": 2})
+
+
+class CacheArrayTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.array = CacheArray("array", chunk_size=2)
+        for key in ("a:1", "a:2", "ab:1", "b:1", "c"):
+            self.array.add(key, key)
+
+    def testPrefix(self):
+        self.assertEqual(sorted(self.array.members("a")), ["a:1", "a:2", "ab:1"])
+        self.assertEqual(sorted(self.array.group("a")), ["a:1", "a:2"])
+        self.assertEqual(list(self.array.group("c")), [])
+        self.assertEqual(len(self.array.members()), 5)
+
+        self.array.remove("a:1")
+        self.assertEqual(list(self.array.group("a")), ["a:2"])
+        self.assertIsNone(self.array.get("a:1"))
+
+    def testIterMembers(self):
+        # chunk_size is 2, so this takes several ranges
+        self.assertEqual(
+            list(self.array.iter_members()), ["a:1", "a:2", "ab:1", "b:1", "c"])
+        self.assertEqual(list(self.array.iter_members("a:")), ["a:1", "a:2"])
+
+    def testMigrate(self):
+        # older releases kept the keys in a set
+        con = cache.client.get_client()
+        legacy = self.array.get_key("set")
+        for key in ("d:1", "d:2", "e"):
+            con.sadd(legacy, self.array.get_key(key))
+            cache.set(self.array.get_key(key), key)
+
+        array = CacheArray("array", chunk_size=2)
+        self.assertEqual(sorted(array.group("d")), ["d:1", "d:2"])
+        self.assertEqual(len(array.members()), 8)
+        self.assertFalse(con.exists(legacy))
+
+    def testClear(self):
+        generation = self.array.generation()
+        self.array.clear()
+        self.assertEqual(list(self.array.members()), [])
+        self.assertIsNone(self.array.get("b:1"))
+        self.assertNotEqual(self.array.generation(), generation)
+
+
+class LocalCacheTestCase(TestCase):
+
+    def testVersionMismatch(self):
+        local = LocalCache()
+        local.set("a", 1, {"1": 1})
+        self.assertEqual(local.get("a", 1), {"1": 1})
+        self.assertIsNone(local.get("a", 2))
+        self.assertIsNone(local.get("a", 1))
+        self.assertEqual(local.objects, 0)
+
+    def testEviction(self):
+        local = LocalCache(max_entries=2, max_objects=3)
+        local.set("a", 1, {"1": 1})
+        local.set("b", 1, {"1": 1})
+        local.get("a", 1)
+        local.set("c", 1, {"1": 1})
+        self.assertIsNone(local.get("b", 1))
+        self.assertIsNotNone(local.get("a", 1))
+
+        local.set("d", 1, {"1": 1, "2": 2})
+        self.assertEqual(local.objects, 3)
+        self.assertIsNone(local.get("c", 1))
+
+
 class BindingTestCase(TestCase):
 
     def setUp(self):
@@ -100,6 +265,13 @@ class BindingTestCase(TestCase):
             self.assertIn(item.id, dataset)
         self.assertEqual(len(dataset), 3)
 
+    def testMetadata(self):
+        version, last_modified = self.binding.metadata()
+        self.assertEqual(version, self.binding.current_version())
+        self.assertEqual(last_modified, self.binding.last_modified)
+        self.binding.bump()
+        self.assertEqual(self.binding.metadata()[0], version + 1)
+
     def testLastModifiedUpdated(self):
         dt = self.binding.last_modified
         Product.objects.create(name="t4", venue="online")
@@ -130,6 +302,363 @@ class BindingTestCase(TestCase):
         # send changes since a given date
         pass
 
+    def testLocalCache(self):
+        self.binding.local_cache = True
+        self.binding.local_objects.clear()
+        self.assertEqual(len(self.binding.all()), 3)
+
+        # unchanged version is served from process memory
+        self.binding.object_cache.cache.delete(
+            self.binding.object_cache.get_key(str(self.t1.id)))
+        self.assertEqual(len(self.binding.all()), 3)
+
+        # a bump invalidates the local copy
+        self.binding.bump()
+        self.assertEqual(len(self.binding.all()), 2)
+
+    def testLocalCacheCleared(self):
+        self.binding.local_cache = True
+        self.binding.local_objects.clear()
+        version = self.binding.current_version()
+        self.assertEqual(self.binding.all()["2"].name, "t2")
+
+        # another process clears the binding, which starts its version over
+        other = TestBinding()
+        other.local_objects = LocalCache()
+        Product._base_manager.filter(pk=self.t2.pk).update(name="changed")
+        other.clear(objects=True)
+        other.all()
+        other.meta_cache.set("version", version)
+
+        self.assertEqual(self.binding.current_version(), version)
+        self.assertEqual(self.binding.all()["2"].name, "changed")
+
+    def testAtomicWrites(self):
+        self.binding.atomic_writes = True
+        version = self.binding.current_version()
+        dt = self.binding.last_modified
+
+        t4 = Product(id=1000, name="t4", venue="online")
+        self.assertEqual(self.binding.save_instance(t4, True), version + 1)
+        self.assertEqual(self.binding.current_version(), version + 1)
+        self.assertNotEqual(self.binding.last_modified, dt)
+        self.assertIn("1000", self.binding.all())
+
+        self.assertEqual(self.binding.delete_instance(t4), version + 2)
+        self.assertNotIn("1000", self.binding.all())
+        self.assertEqual(
+            [action for action, data in self.binding.outbox],
+            ["create", "delete"])
+
+        # removing something that isn't bound doesn't bump
+        self.assertIsNone(self.binding.delete_instance(t4))
+        self.assertEqual(self.binding.current_version(), version + 2)
+        self.assertEqual(self.binding.bump(), version + 3)
+
+    def testDispatchIndex(self):
+        bindings = get_bindings(Product)
+        self.assertEqual(
+            [b.bindings_key for b in bindings], [self.binding.bindings_key])
+
+        # unchanged registry reuses the same binding objects
+        self.assertIs(get_bindings(Product)[0], bindings[0])
+
+        # changing the registry reloads them
+        self.binding.bindings.add(self.binding.bindings_key, self.binding)
+        self.assertIsNot(get_bindings(Product)[0], bindings[0])
+
+        # a lost generation is replaced, bindings are cached again
+        bindings = get_bindings(Product)
+        array = self.binding.bindings
+        self.assertEqual(array.con.ttl(array.generation_key), -1)
+        array.con.delete(array.generation_key)
+        bindings = get_bindings(Product)
+        self.assertIs(get_bindings(Product)[0], bindings[0])
+
+        self.binding.bindings.remove(self.binding.bindings_key)
+        self.assertEqual(get_bindings(Product), [])
+
+    def testBulkCreate(self):
+        version = self.binding.current_version()
+        Product.objects.bulk_create([
+            Product(name="t-{}".format(x), venue="online")
+            for x in range(10)
+        ])
+        self.assertEqual(len(self.binding.keys()), 13)
+        self.assertEqual(self.binding.current_version(), version + 1)
+        self.assertEqual(len(self.binding.outbox), 1)
+        action, data = self.binding.outbox[0]
+        self.assertEqual(action, "bulk")
+        self.assertEqual(len(data["update"]), 10)
+
+    def testBulkUpdate(self):
+        self.binding.filters = dict(venue="store")
+        self.binding.bindings.add(self.binding.bindings_key, self.binding)
+        self.binding.clear()
+        self.binding.all()
+        version = self.binding.current_version()
+
+        Product.objects.filter(name__in=["t1", "t3"]).update(venue="website")
+        self.binding._version = None
+        self.assertEqual(self.binding.keys(), set([b"2"]))
+        self.assertEqual(self.binding.current_version(), version + 1)
+        self.assertEqual(
+            self.binding.outbox,
+            [("bulk", dict(update={}, delete=[str(self.t1.id)]))])
+
+        # nothing bound changes
+        self.binding.clearMessages()
+        Product.objects.filter(name="t3").update(name="t3")
+        self.assertEqual(self.binding.current_version(), version + 1)
+        self.assertEqual(len(self.binding.outbox), 0)
+
+    def testBulkDelete(self):
+        version = self.binding.current_version()
+        self.binding.models_deleted([self.t1, self.t2.id, 1000])
+        self.assertEqual(self.binding.keys(), set([str(self.t3.id).encode()]))
+        self.assertEqual(self.binding.current_version(), version + 1)
+        self.assertEqual(len(self.binding.outbox), 1)
+
+    def testBulkLookupField(self):
+        binding = NamedBinding(name="named")
+        self.assertEqual(sorted(binding.keys()), [b"t1", b"t2", b"t3"])
+        binding.clearMessages()
+
+        # values are looked up by the lookup field
+        self.assertIsNotNone(binding.models_saved(["t1", "gone"]))
+        self.assertEqual(list(binding.outbox[0][1]["update"]), ["t1"])
+        binding.models_deleted(["t2"])
+        self.assertEqual(sorted(binding.keys()), [b"t1", b"t3"])
+        # primary keys can't be told apart from names
+        self.assertEqual(binding.get_pk_keys([self.t1.pk]), [])
+        self.assertEqual(self.binding.get_pk_keys([self.t1.pk]), ["1"])
+
+    def testRefresh(self):
+        version = self.binding.current_version()
+        self.assertEqual(self.binding.refresh(), (0, 0))
+        self.assertEqual(self.binding.current_version(), version)
+
+        # lose an object, a membership and gain a stray key
+        self.binding.object_cache.cache.delete(
+            self.binding.object_cache.get_key(str(self.t1.id)))
+        self.binding.meta_cache.set_remove("objects", str(self.t2.id))
+        self.binding.meta_cache.set_add("objects", "1000")
+        self.binding.object_cache.set("1000", self.t3)
+
+        calls = []
+        self.assertEqual(self.binding.refresh(
+            chunk_size=2, progress=lambda *a: calls.append(a)), (2, 1))
+        self.assertEqual(calls[-1], (3, 2, 1))
+        self.assertEqual(self.binding.current_version(), version + 1)
+        self.assertEqual(len(self.binding.all()), 3)
+        self.assertEqual(
+            sorted(k.decode() for k in self.binding.keys()),
+            sorted(str(t.id) for t in [self.t1, self.t2, self.t3]))
+        # the object of a row that is gone is dropped
+        self.assertIsNone(self.binding.object_cache.get("1000"))
+
+        # the changes are sent a chunk at a time
+        actions = [action for action, data in self.binding.outbox]
+        self.assertEqual(set(actions), set(["bulk"]))
+        self.assertGreater(len(actions), 1)
+        self.assertEqual(
+            sorted(key for action, data in self.binding.outbox
+                   for key in data["update"]),
+            sorted(str(t.id) for t in [self.t1, self.t2]))
+        self.assertEqual(
+            [key for action, data in self.binding.outbox
+             for key in data["delete"]], ["1000"])
+
+    def testPaging(self):
+        for x in range(9):
+            Product.objects.create(name="t-{}".format(x), venue="online")
+        self.assertEqual(self.binding.count(), 12)
+        self.assertEqual(self.binding.page_keys(8, 5), ["9", "10", "11", "12"])
+        self.assertEqual(list(self.binding.page(0, 2).keys()), ["1", "2"])
+        self.assertEqual(self.binding.offset_after("10"), 10)
+        self.binding.models_deleted(["10"])
+        self.assertEqual(self.binding.offset_after("10"), 9)
+
+        # keys that aren't numbers follow, as strings
+        named = NamedBinding(name="named")
+        names = sorted(Product.objects.values_list("name", flat=True))
+        self.assertEqual(named.sorted_keys(), names)
+        named.models_deleted(["t2"])
+        self.assertEqual(named.offset_after("t2"), names.index("t2"))
+        self.assertEqual(named.offset_after("t1"), names.index("t1") + 1)
+
+    def testOrderedPaging(self):
+        self.binding.ordered = True
+        self.binding.ordering_field = "name"
+        # nothing is scored by name, members fall back to key order
+        self.binding.rebuild_indexes()
+        self.assertEqual(self.binding.page_keys(0, 10), ["1", "2", "3"])
+
+        self.binding.ordering_field = "created"
+        self.binding.rebuild_indexes()
+        t4 = Product.objects.create(name="t4", venue="online")
+        self.binding.save_instance(t4, True)
+        self.assertEqual(self.binding.page_keys(2, 10), ["3", "4"])
+
+        self.binding.atomic_writes = True
+        self.binding.delete_instance(self.t3)
+        self.binding.delete_instance(self.t1)
+        self.assertEqual(self.binding.page_keys(0, 10), ["2", "4"])
+
+    def testRebuildIndexes(self):
+        # a member whose index isn't written yet, as while another worker
+        # saves, doesn't make the next binding rebuild
+        self.binding.member_set.add("999")
+        with mock.patch.object(TestBinding, "rebuild_indexes") as rebuild:
+            TestBinding()
+            self.assertEqual(rebuild.call_count, 0)
+            # a different layout rebuilds once
+            IndexedBinding()
+            self.assertEqual(rebuild.call_count, 1)
+
+        # members are scored even when their object isn't cached
+        self.binding.member_set.remove("999")
+        self.binding.object_cache.cache.delete(
+            self.binding.object_cache.get_key("1"))
+        self.binding.rebuild_indexes()
+        self.assertEqual(self.binding.sorted_keys(), ["1", "2", "3"])
+
+        # the objects of codec bindings carry dates as strings
+        binding = JSONBinding(name="json-ordered")
+        binding.ordered = True
+        binding.ordering_field = "created"
+        binding.rebuild_indexes()
+        scores = binding.meta_cache.sorted_range(
+            "ordered", 0, -1, withscores=True)
+        # json keeps milliseconds
+        for (key, score), t in zip(scores, [self.t1, self.t2, self.t3]):
+            self.assertAlmostEqual(score, binding.get_ordering_score(t), 2)
+        self.assertGreater(scores[0][1], 0)
+
+    def testBumpMissingVersion(self):
+        self.binding.meta_cache.con.delete(
+            self.binding.meta_cache.make_key("version"))
+        self.assertEqual(self.binding.bump(), 1)
+        self.assertEqual(self.binding.metadata()[0], 1)
+
+    def testChangelog(self):
+        self.binding.changelog_size = 2
+        self.assertIsNone(self.binding.changes_since(1))
+        self.binding.bump()
+        version = self.binding.current_version()
+        self.assertEqual(
+            self.binding.changes_since(version), dict(update={}, delete=[]))
+
+        self.t1.name = "changed"
+        self.binding.save_instance(self.t1, False)
+        self.binding.delete_instance(self.t2)
+        changes = self.binding.changes_since(version)
+        self.assertEqual(list(changes["update"].keys()), [str(self.t1.id)])
+        self.assertEqual(changes["delete"], [str(self.t2.id)])
+        self.assertEqual(
+            list(self.binding.changes_since(version + 1)["update"]), [])
+
+        # the oldest change falls out of the log
+        self.binding.save_instance(self.t3, False)
+        self.assertIsNone(self.binding.changes_since(version))
+        self.assertEqual(
+            self.binding.changes_since(version + 1)["delete"],
+            [str(self.t2.id)])
+
+        # unknown changes need a full sync
+        self.binding.bump()
+        self.assertIsNone(self.binding.changes_since(version + 3))
+        self.assertIsNone(self.binding.changes_since(version + 10))
+
+    def testIndexes(self):
+        self.binding.indexes = ("venue",)
+        self.binding.rebuild_indexes()
+        self.assertEqual(
+            sorted(self.binding.filter(venue="store")), ["1", "2"])
+        self.assertEqual(
+            sorted(self.binding.filter(venue=["store", "online"])),
+            ["1", "2", "3"])
+        self.assertEqual(
+            list(self.binding.filter(venue="store", name="t2")), ["2"])
+        self.assertEqual(self.binding.filter(venue="website"), {})
+
+        # moves between values
+        self.t1.venue = "online"
+        self.binding.save_instance(self.t1, False)
+        self.assertEqual(sorted(self.binding.filter(venue="online")), ["1", "3"])
+        self.assertEqual(list(self.binding.filter(venue="store")), ["2"])
+
+        self.binding.atomic_writes = True
+        self.binding.delete_instance(self.t3)
+        self.binding.models_deleted([self.t2])
+        self.assertEqual(list(self.binding.filter(venue="online")), ["1"])
+        self.assertEqual(self.binding.filter(venue="store"), {})
+
+        self.assertRaises(ValueError, self.binding.filter_keys, name="t1")
+        self.binding.clear()
+        self.assertEqual(self.binding.filter(venue="online"), {})
+
+    def testIndexValues(self):
+        binding = FlaggedBinding(name="flagged")
+        self.assertEqual(sorted(binding.filter(online=False)), ["1", "2"])
+        self.assertEqual(list(binding.filter(rating=None)), ["1"])
+        self.assertEqual(sorted(binding.filter(rating=[None, 5])), ["1", "2", "3"])
+        # as they arrive in query strings
+        self.assertEqual(binding.filter_keys(online="true"), ["3"])
+        self.assertEqual(binding.filter_keys(rating="null"), ["1"])
+
+        # moves between values
+        self.t1.venue = "online"
+        binding.save_instance(self.t1, False)
+        self.assertEqual(sorted(binding.filter_keys(online="true")), ["1", "3"])
+        self.assertEqual(binding.filter_keys(online="false"), ["2"])
+
+    def testClear(self):
+        self.binding.indexes = ("venue",)
+        self.binding.ordered = True
+        self.binding.rebuild_indexes()
+        self.binding.clear()
+        self.assertIsNone(self.binding.current_version())
+        self.assertEqual(self.binding.keys(), [])
+        self.assertEqual(self.binding.filter(venue="store"), {})
+        self.assertEqual(self.binding.sorted_keys(), [])
+        self.assertEqual(
+            list(cache.client.get_client().scan_iter(
+                self.binding.meta_cache.get_key("index:*"))), [])
+        # objects are shared with other bindings of the model
+        self.assertIsNotNone(self.binding.object_cache.get("1"))
+
+        # the objects of the members are unlinked
+        self.binding.all()
+        self.binding.clear(objects=True)
+        self.assertIsNone(self.binding.object_cache.get("1"))
+        self.assertEqual(len(self.binding.all()), 3)
+
+    def testModelMatches(self):
+        self.binding.excludes = dict(venue="online")
+        self.assertTrue(self.binding.model_matches(self.t1))
+        self.assertFalse(self.binding.model_matches(self.t3))
+
+        # lookups python can't answer are checked in the database
+        self.binding.excludes = dict(name__regex="^t[12]$")
+        self.assertIsNone(self.binding.get_predicate())
+        self.assertFalse(self.binding.model_matches(self.t1))
+        self.assertTrue(self.binding.model_matches(self.t3))
+
+        # with a single query for many instances
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.binding.models_matching([self.t1, self.t2, self.t3]),
+                set([self.t3.pk]))
+        self.binding.excludes = None
+
+    def testMissingRelated(self):
+        binding = ReviewBinding()
+        review = Review(product_id=9999, rating=5)
+        # the related product isn't there, the database has the answer
+        self.assertFalse(binding.model_matches(review))
+        self.assertEqual(binding.models_matching([review]), set())
+
     def testFilteredInitialPayload(self):
         # filter `all`
         self.binding.filters["venue"] = "store"
@@ -237,3 +766,225 @@ class BindingTestCase(TestCase):
 
         self.assertEqual(len(self.binding.outbox), 1)
         self.assertEqual(len(self.binding.all().keys()), 1)
+
+
+class ReviewBinding(TestBinding):
+    model = Review
+    filters = dict(product__name="t1")
+
+
+class IndexedBinding(TestBinding):
+    indexes = ("venue",)
+
+
+class NamedBinding(TestBinding):
+
+    def get_lookup_field(self):
+        return "name"
+
+
+class FlaggedBinding(TestBinding):
+    indexes = ("online", "rating")
+
+    def create_object_cache(self):
+        # not the model's shared objects, they're serialized differently
+        cache = super(FlaggedBinding, self).create_object_cache()
+        cache.prefix += ":flagged"
+        return cache
+
+    def serialize_object(self, obj):
+        return dict(
+            id=obj.id,
+            online=obj.venue == "online",
+            rating=None if obj.name == "t1" else len(obj.name) * 2 + 1,
+        )
+
+
+class ShardedBinding(TestBinding):
+    shards = 4
+
+
+class ShardedTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for x in range(20):
+            Product.objects.create(name="t{}".format(x), venue="store")
+        self.binding = ShardedBinding(name="sharded")
+
+    def testMembers(self):
+        members = self.binding.member_set
+        self.assertEqual(len(members.keys), 4)
+        self.assertEqual(members.get_shard_key("1"), members.get_shard_key("1"))
+        self.assertGreater(
+            len([key for key in members.keys if cache.client.get_client().scard(key)]), 1)
+
+        self.assertEqual(self.binding.count(), 20)
+        self.assertEqual(len(self.binding.all()), 20)
+        self.assertEqual(len(self.binding.keys()), 20)
+        self.assertEqual(len(self.binding.page(0, 5)), 5)
+
+        # shards are scanned together and members read in chunks
+        keys = sorted(key.decode() for key in members.iter(count=2))
+        self.assertEqual(keys, sorted(key.decode() for key in self.binding.keys()))
+        objects = self.binding.object_cache.get_many_raw(keys, chunk_size=3)
+        self.assertEqual(sorted(objects), keys)
+
+    def testWrites(self):
+        Product.objects.create(name="t20", venue="store")
+        self.assertEqual(self.binding.count(), 21)
+        Product.objects.get(name="t3").delete()
+        self.binding.atomic_writes = True
+        Product.objects.get(name="t4").delete()
+        self.assertEqual(self.binding.count(), 19)
+        self.assertEqual(self.binding.refresh(), (0, 0))
+
+        self.binding.clear()
+        self.assertEqual(self.binding.count(), 0)
+        self.assertEqual(len(self.binding.all()), 19)
+
+    def testReshard(self):
+        old = self.binding.member_set.keys
+
+        class Resharded(TestBinding):
+            shards = 3
+
+        binding = Resharded(name="sharded")
+        self.assertEqual(binding.count(), 20)
+        self.assertEqual(len(set(old) & set(binding.member_set.keys)), 0)
+        self.assertEqual(cache.client.get_client().exists(*old), 0)
+        self.assertEqual(binding.meta_cache.get("shards"), 3)
+
+
+class HashedBinding(TestBinding):
+    hashed_objects = True
+    codec = "json"
+    atomic_writes = True
+
+
+class HashedBindingTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.t1 = Product.objects.create(name="t1", venue="store")
+        self.t2 = Product.objects.create(name="t2", venue="store")
+        self.binding = HashedBinding(name="hashed")
+
+    def testReadWrite(self):
+        self.assertIsInstance(self.binding.object_cache, HashCacheDict)
+        self.assertEqual(
+            sorted(o["name"] for o in self.binding.all().values()),
+            ["t1", "t2"])
+        self.t1.name = "changed"
+        self.t1.save()
+        self.assertEqual(self.binding.all()["1"]["name"], "changed")
+        self.assertEqual(list(self.binding.page(1, 1).keys()), ["2"])
+        self.t2.delete()
+        self.assertEqual(list(self.binding.all().keys()), ["1"])
+
+        self.binding.clear(objects=True)
+        self.assertIsNone(self.binding.object_cache.get("1"))
+        self.assertEqual(self.binding.all()["1"]["name"], "changed")
+
+    def testCodecRequired(self):
+        with self.assertRaises(ImproperlyConfigured):
+            PickledHashedBinding(name="pickled")
+
+
+class PickledHashedBinding(TestBinding):
+    hashed_objects = True
+
+
+class CountingBinding(TestBinding):
+    atomic_writes = True
+    serialized = []
+
+    def serialize_object(self, obj):
+        self.serialized.append(obj)
+        return obj
+
+
+class FanOutTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.t1 = Product.objects.create(name="t1", venue="store")
+        self.bindings = [
+            CountingBinding(name="a"),
+            CountingBinding(name="b"),
+            TestBinding(name="c"),
+        ]
+        self.bindings[0].filters = dict(venue="store")
+        self.bindings[0].bindings.add(
+            self.bindings[0].bindings_key, self.bindings[0])
+        del CountingBinding.serialized[:]
+        self.bindings[0].clearMessages()
+
+    def testSerializeOnce(self):
+        versions = [b.current_version() for b in self.bindings]
+        t2 = Product.objects.create(name="t2", venue="store")
+        self.assertEqual(CountingBinding.serialized, [t2])
+        self.assertEqual(
+            [b.current_version() for b in self.bindings],
+            [v + 1 for v in versions])
+        for binding in self.bindings:
+            self.assertIn(str(t2.id), binding.all())
+        self.assertEqual(len(self.bindings[0].outbox), 3)
+
+        # only the bindings that match change
+        Product.objects.create(name="t3", venue="online")
+        self.assertEqual(
+            [b.current_version() for b in self.bindings],
+            [versions[0] + 1, versions[1] + 2, versions[2] + 2])
+
+    def testFailingBinding(self):
+        versions = [b.current_version() for b in self.bindings]
+        failing = mock.Mock()
+        failing.model_saved.side_effect = RuntimeError("broken")
+        with mock.patch("binding.listeners.get_bindings",
+                        return_value=self.bindings[:2] + [failing]):
+            with self.assertRaises(RuntimeError):
+                Product.objects.create(name="t2", venue="store")
+
+        # the bindings before the failing one were still written
+        t2 = Product.objects.get(name="t2")
+        self.assertEqual(
+            [b.current_version() for b in self.bindings[:2]],
+            [v + 1 for v in versions[:2]])
+        for binding in self.bindings[:2]:
+            self.assertIn(str(t2.id), binding.all())
+
+
+class MsgpackBinding(TestBinding):
+    codec = "msgpack"
+
+
+class CodecTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.t1 = Product.objects.create(name="t1", venue="store")
+        self.t2 = Product.objects.create(name="t2", venue="store")
+
+    def testJSON(self):
+        binding = JSONBinding(name="json")
+        objects = binding.all()
+        self.assertEqual(objects[str(self.t1.id)]["name"], "t1")
+        raw = binding.all_raw()
+        self.assertEqual(json.loads(raw[str(self.t2.id)].decode())["name"], "t2")
+        self.assertEqual(
+            len(json.loads(binding.object_cache.codec.join(raw.values()))), 2)
+
+        self.t1.name = "changed"
+        self.t1.save()
+        self.assertEqual(binding.all()[str(self.t1.id)]["name"], "changed")
+
+    @unittest.skipIf(msgpack is None, "msgpack isn't installed")
+    def testMsgpack(self):
+        binding = MsgpackBinding(name="msgpack")
+        objects = binding.all()
+        self.assertEqual(objects[str(self.t1.id)]["venue"], "store")
+        self.assertEqual(
+            objects[str(self.t1.id)]["created"], self.t1.created.isoformat())
+        joined = binding.object_cache.codec.join(binding.all_raw().values())
+        self.assertEqual(len(msgpack.unpackb(joined, raw=False)), 2)
@@ -1,16 +1,21 @@
+import base64
+import json
 import time
 
 from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 from django.utils.http import http_date
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.serializers import Serializer
 from rest_framework.test import APIRequestFactory
 
 from binding_test.models import Product
 
-from ..drf import BoundModelViewSet
-from ._binding import TestBinding
+from ..drf import BindingCursorPagination, BindingList, BoundModelViewSet
+from ._binding import JSONBinding, TestBinding
 
 
 class ProductSerializer(Serializer):
@@ -22,6 +27,62 @@ class TestBoundModelViewset(BoundModelViewSet):
     serializer_class = ProductSerializer
 
 
+class RawBoundModelViewset(BoundModelViewSet):
+    model = Product
+    serializer_class = ProductSerializer
+    raw_list = True
+
+
+class CachedBoundModelViewset(BoundModelViewSet):
+    model = Product
+    serializer_class = ProductSerializer
+    cache_list_responses = True
+
+
+class EarlyBoundModelViewset(BoundModelViewSet):
+    model = Product
+    serializer_class = ProductSerializer
+    permission_classes = (IsAuthenticated,)
+    early_not_modified = True
+
+
+class IndexedBinding(TestBinding):
+    indexes = ("venue",)
+
+
+class NewestFirstBinding(IndexedBinding):
+    ordered = True
+
+    def get_ordering_score(self, obj):
+        return -obj.id
+
+
+class IndexedBoundModelViewset(BoundModelViewSet):
+    model = Product
+    serializer_class = ProductSerializer
+    index_filters = True
+
+
+class ProductNameSerializer(Serializer):
+
+    def to_representation(self, instance):
+        if isinstance(instance, dict):
+            return instance["name"]
+        return instance.name
+
+
+class PagedBoundModelViewset(BoundModelViewSet):
+    model = Product
+    serializer_class = ProductNameSerializer
+    pagination_class = LimitOffsetPagination
+
+
+class CursorBoundModelViewset(BoundModelViewSet):
+    model = Product
+    serializer_class = ProductNameSerializer
+    pagination_class = BindingCursorPagination
+
+
 class BoundModelViewsetTestCase(TestCase):
 
     def setUp(self):
@@ -100,6 +161,20 @@ class BoundModelViewsetTestCase(TestCase):
         ))
         self.assertEqual(response.status_code, 304)
 
+    def testEarlyNotModified(self):
+        EarlyBoundModelViewset.binding = TestBoundModelViewset.binding
+        view = EarlyBoundModelViewset.as_view({"get": "list"})
+        etag = '"{}"'.format(self.viewset.get_binding().version)
+
+        response = self.api(view, headers=dict(HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        # anything else goes through the view
+        self.assertEqual(self.api(view).status_code, 403)
+        response = self.api(view, headers=dict(HTTP_IF_NONE_MATCH='"0"'))
+        self.assertEqual(response.status_code, 403)
+
     def testAdded(self):
         etag = str(self.viewset.get_binding().version)
 
@@ -130,3 +205,112 @@ class BoundModelViewsetTestCase(TestCase):
             HTTP_IF_NONE_MATCH=etag
         ))
         self.assertEqual(response.status_code, 200)
+
+    def testRawList(self):
+        RawBoundModelViewset.binding = JSONBinding(name="json")
+        view = RawBoundModelViewset.as_view({"get": "list"})
+        response = self.api(view)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(
+            sorted(o["name"] for o in json.loads(response.content.decode())),
+            ["t1", "t2", "t3"])
+
+    def testCachedList(self):
+        CachedBoundModelViewset.binding = TestBoundModelViewset.binding
+        view = CachedBoundModelViewset.as_view({"get": "list"})
+        binding = CachedBoundModelViewset.binding
+        response = self.api(view)
+        response.render()
+        self.assertEqual(response.status_code, 200)
+
+        key = CachedBoundModelViewset().get_list_cache_key(
+            response.renderer_context["request"], *binding.metadata())
+        content, content_type = binding.meta_cache.get(key)
+        self.assertEqual(content, response.content)
+
+        # served from the cache until the version changes
+        binding.meta_cache.set(key, (b"[]", content_type))
+        self.assertEqual(self.api(view).content, b"[]")
+        Product.objects.create(name="t4")
+        response = self.api(view)
+        response.render()
+        self.assertNotEqual(response.content, b"[]")
+
+    def testIndexFilters(self):
+        IndexedBoundModelViewset.binding = IndexedBinding(name="indexed")
+        view = IndexedBoundModelViewset.as_view({"get": "list"})
+        viewset = IndexedBoundModelViewset()
+        viewset.request = Request(
+            self.factory.get("/products/", data={"venue": "online"}))
+        self.assertEqual(list(viewset.get_queryset()), [self.t3])
+        self.assertEqual(self.api(view, data={"venue": "store"}).status_code, 200)
+
+    def testBindingList(self):
+        objects = BindingList(TestBoundModelViewset.binding)
+        self.assertEqual(len(objects), 3)
+        self.assertEqual(objects[1:], [self.t2, self.t3])
+        self.assertEqual(objects[0], self.t1)
+        self.assertEqual(objects[-1], self.t3)
+        self.assertEqual(list(objects), [self.t1, self.t2, self.t3])
+
+        # filtered lists keep the binding's order
+        binding = NewestFirstBinding(name="newest")
+        objects = BindingList(binding, dict(venue=["store", "online"]))
+        self.assertEqual(list(objects), [self.t3, self.t2, self.t1])
+        self.assertEqual(objects[1:], [self.t2, self.t1])
+
+    def testLimitOffset(self):
+        PagedBoundModelViewset.binding = TestBoundModelViewset.binding
+        view = PagedBoundModelViewset.as_view({"get": "list"})
+        response = self.api(view, data={"limit": 2, "offset": 1})
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(response.data["results"], ["t2", "t3"])
+
+    def testCursor(self):
+        binding = TestBinding(name="cursor")
+        binding.ordered = True
+        binding.ordering_field = "name"
+        binding.rebuild_indexes()
+        CursorBoundModelViewset.binding = binding
+        view = CursorBoundModelViewset.as_view({"get": "list"})
+
+        page_size = CursorBoundModelViewset.pagination_class.page_size
+        CursorBoundModelViewset.pagination_class.page_size = 2
+        try:
+            response = self.api(view)
+            self.assertEqual(response.data["results"], ["t1", "t2"])
+            cursor = response.data["next"].split("cursor=")[1]
+
+            # removing the cursor's key doesn't lose the position
+            binding.delete_instance(self.t2)
+            response = self.api(view, data={"cursor": cursor})
+            self.assertEqual(response.data["results"], ["t3"])
+            self.assertIsNone(response.data["next"])
+        finally:
+            CursorBoundModelViewset.pagination_class.page_size = page_size
+
+    def testCodecCursor(self):
+        binding = JSONBinding(name="cursor-json")
+        binding.ordered = True
+        binding.ordering_field = "created"
+        binding.rebuild_indexes()
+        CursorBoundModelViewset.binding = binding
+        view = CursorBoundModelViewset.as_view({"get": "list"})
+
+        page_size = CursorBoundModelViewset.pagination_class.page_size
+        CursorBoundModelViewset.pagination_class.page_size = 1
+        try:
+            response = self.api(view)
+            cursor = response.data["next"].split("cursor=")[1]
+            # the cursor has the score the key was indexed with
+            self.assertEqual(
+                json.loads(base64.urlsafe_b64decode(
+                    cursor + "=" * (-len(cursor) % 4)).decode("utf8")),
+                ["1", binding.stored_score("1")])
+
+            binding.delete_instance(self.t1)
+            response = self.api(view, data={"cursor": cursor})
+            self.assertEqual(response.data["results"], ["t2"])
+        finally:
+            CursorBoundModelViewset.pagination_class.page_size = page_size
@@ -0,0 +1,80 @@
+import datetime
+
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+
+from binding_test.models import Product, Review
+
+from ..lookups import Unsupported, compile_predicate
+
+
+class CompiledPredicateTestCase(TestCase):
+
+    def setUp(self):
+        self.t1 = Product.objects.create(name="Apple", venue="store")
+        self.t2 = Product.objects.create(name="banana", venue="website")
+        self.t3 = Product.objects.create(name="Cherry", venue="website")
+        Review.objects.create(product=self.t1, rating=5, text="good")
+        Review.objects.create(product=self.t2, rating=None)
+        Review.objects.create(product=self.t3, rating=2, text="bad")
+
+    def assertMirrorsORM(self, model, filters=None, excludes=None, q=()):
+        predicate = compile_predicate(model, filters, excludes, q)
+        qs = model.objects.filter(*q, **(filters or {}))
+        if excludes:
+            qs = qs.exclude(**excludes)
+        expected = set(qs.values_list("pk", flat=True))
+        for instance in model.objects.all():
+            self.assertEqual(
+                predicate(instance), instance.pk in expected,
+                "{} {} {} {}".format(instance.pk, filters, excludes, q))
+
+    def testLookups(self):
+        for filters in [
+            {},
+            dict(venue="store"),
+            dict(venue__in=["store", "outlet"]),
+            dict(name__iexact="apple"),
+            dict(name__icontains="AN"),
+            dict(name__startswith="C"),
+            dict(name__istartswith="c"),
+            dict(name__endswith="y"),
+            dict(pk__gte=self.t2.pk),
+            dict(id__lt=str(self.t3.pk)),
+            dict(id__range=(self.t1.pk, self.t2.pk)),
+            dict(created__lte=timezone.now()),
+            dict(created__gt=timezone.now() - datetime.timedelta(days=1)),
+        ]:
+            self.assertMirrorsORM(Product, filters)
+
+    def testExcludesAndQ(self):
+        self.assertMirrorsORM(
+            Product, excludes=dict(venue="website", name="banana"))
+        self.assertMirrorsORM(
+            Product, q=(Q(venue="store") | Q(name__contains="an"),))
+        self.assertMirrorsORM(
+            Product, dict(venue="website"), q=(~Q(name="Cherry"),))
+
+    def testRelated(self):
+        for filters in [
+            dict(product=self.t1),
+            dict(product_id=self.t1.pk),
+            dict(product__in=[self.t1, self.t3]),
+            dict(product__pk=self.t2.pk),
+            dict(product__venue="website"),
+            dict(rating__isnull=True),
+            dict(rating__isnull=False, rating__gte=3),
+            dict(rating=None),
+        ]:
+            self.assertMirrorsORM(Review, filters)
+
+    def testUnsupported(self):
+        for filters in [
+            dict(created__year=2000),
+            dict(name__regex="^A"),
+            dict(reviews__rating=5),
+            dict(pk__in=Product.objects.all()),
+        ]:
+            self.assertRaises(
+                Unsupported, compile_predicate, Product, filters)
@@ -0,0 +1,83 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django_redis import get_redis_connection
+from redis.connection import AbstractConnection, Connection
+from six import StringIO
+
+from binding_test.models import Product
+
+from .. import metrics
+from ._binding import TestBinding
+
+
+class Counted(object):
+    name = "counted"
+
+    @metrics.instrument("pipelined")
+    def pipelined(self):
+        pipe = get_redis_connection().pipeline(transaction=False)
+        pipe.set("counted", 1)
+        pipe.incr("counted")
+        pipe.delete("counted")
+        return pipe.execute()
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.t1 = Product.objects.create(name="t1", venue="store")
+        self.binding = TestBinding(name="metered")
+        self.exported = []
+        metrics.exporters.append(self.exported.append)
+        metrics.snapshot(reset=True)
+        self.send_command = AbstractConnection.send_command
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.exporters.remove(self.exported.append)
+        metrics.RedisExporter().clear()
+
+    def testCounters(self):
+        self.binding.all()
+        self.binding.bump()
+        stats = metrics.snapshot()["metered"]
+        self.assertEqual(stats["all"]["calls"], 1)
+        self.assertEqual(stats["all"]["hits"], 1)
+        self.assertEqual(sum(stats["all"]["buckets"]), 1)
+        self.assertGreater(stats["bump"]["commands"], 0)
+        self.assertGreater(stats["bump"]["bytes_sent"], 0)
+
+    def testPipelineCommands(self):
+        counted = Counted()
+        counted.pipelined()
+        stats = metrics.snapshot()["counted"]["pipelined"]
+        self.assertEqual(stats["commands"], 3)
+        self.assertGreater(stats["bytes_sent"], 0)
+
+    def testSize(self):
+        self.assertEqual(
+            metrics._size([b"ab", bytearray(b"cd"), memoryview(b"efg")]), 7)
+
+    def testDisabled(self):
+        metrics.disable()
+        self.binding.all()
+        self.assertEqual(metrics.snapshot(), {})
+
+        # the connection is left as it was
+        self.assertNotIn("send_packed_command", Connection.__dict__)
+        self.assertIs(AbstractConnection.send_command, self.send_command)
+
+    def testExport(self):
+        self.binding.all()
+        stats = metrics.flush()
+        self.assertEqual(self.exported, [stats])
+        self.assertEqual(metrics.snapshot(), {})
+        stored = metrics.RedisExporter().read()["metered"]["all"]
+        self.assertEqual(stored["calls"], 1)
+
+        out = StringIO()
+        call_command("bindingstats", binding="metered", stdout=out)
+        self.assertIn("all: 1 calls", out.getvalue())
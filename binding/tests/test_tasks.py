@@ -0,0 +1,217 @@
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from binding_test.models import Product, Review
+
+from ..tasks import (
+    Coalescer, EventBatcher, json_size, model_saved, split_pages,
+    stream_sync)
+from ._binding import JSONBinding, TestBinding
+
+
+class TestCoalescer(Coalescer):
+    scheduled = []
+
+    def schedule(self, label, countdown):
+        self.scheduled.append((label, countdown))
+
+
+class CoalescerTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.t1 = Product.objects.create(name="t1", venue="store")
+        self.binding = TestBinding()
+        self.binding.clearMessages()
+        self.coalescer = TestCoalescer(max_size=3)
+        del self.coalescer.scheduled[:]
+
+    def testBurst(self):
+        # changes that didn't send signals
+        Product._base_manager.filter(pk=self.t1.pk).update(name="changed")
+        t2 = Product(name="t2", venue="store")
+        Product._base_manager.bulk_create([t2])
+        self.assertEqual(self.binding.all()[str(self.t1.pk)].name, "t1")
+        self.binding.clearMessages()
+        version = self.binding.current_version()
+
+        for x in range(2):
+            self.coalescer.add(Product, self.t1.pk)
+        self.coalescer.add(Product, 1000)
+        self.assertEqual(self.coalescer.scheduled, [("binding_test.Product", 0.5)])
+
+        # a full buffer flushes early, once
+        self.coalescer.add(Product, 1001)
+        self.coalescer.add(Product, 1002)
+        self.assertEqual(self.coalescer.scheduled[1:], [("binding_test.Product", 0)])
+
+        self.assertEqual(self.coalescer.flush("binding_test.Product"), 4)
+        self.assertEqual(self.binding.current_version(), version + 1)
+        self.assertEqual(len(self.binding.outbox), 1)
+        self.assertEqual(
+            self.binding.all()[str(self.t1.pk)].name, "changed")
+
+        # the next save starts a new window
+        self.coalescer.add(Product, self.t1.pk)
+        self.assertEqual(len(self.coalescer.scheduled), 3)
+
+    def testFailedFlush(self):
+        Product._base_manager.filter(pk=self.t1.pk).update(name="changed")
+        self.coalescer.add(Product, self.t1.pk)
+        with mock.patch("binding.tasks.get_bindings", side_effect=ValueError):
+            self.assertRaises(
+                ValueError, self.coalescer.flush, "binding_test.Product")
+        self.assertEqual(self.binding.all()[str(self.t1.pk)].name, "t1")
+
+        # the next flush applies what the failed one took
+        self.assertEqual(self.coalescer.flush("binding_test.Product"), 1)
+        self.assertEqual(
+            self.binding.all()[str(self.t1.pk)].name, "changed")
+
+    def testLockedFlush(self):
+        Product._base_manager.filter(pk=self.t1.pk).update(name="changed")
+        self.coalescer.add(Product, self.t1.pk)
+        con = cache.client.get_client()
+        lock = self.coalescer.get_key("binding_test.Product", "lock")
+        processing = self.coalescer.get_key("binding_test.Product", "processing")
+        con.sadd(processing, 1000)
+        con.set(lock, "other")
+
+        # a flush that is running elsewhere keeps its keys
+        self.assertEqual(self.coalescer.flush("binding_test.Product"), 0)
+        self.assertEqual(
+            self.coalescer.scheduled[-1], ("binding_test.Product", 0.5))
+        self.assertEqual(con.smembers(processing), {b"1000"})
+        self.assertEqual(self.binding.all()[str(self.t1.pk)].name, "t1")
+
+        con.delete(lock)
+        self.assertEqual(self.coalescer.flush("binding_test.Product"), 2)
+        self.assertIsNone(con.get(lock))
+        self.assertEqual(
+            self.binding.all()[str(self.t1.pk)].name, "changed")
+
+    def testMaxSize(self):
+        self.assertRaises(ValueError, Coalescer, max_size=8000)
+        self.assertRaises(ValueError, Coalescer, max_size=0)
+
+    def testTask(self):
+        with mock.patch("binding.tasks.coalescer") as coalescer:
+            model_saved.apply((Product, self.t1.pk))
+        coalescer.add.assert_called_once_with(Product, self.t1.pk)
+
+
+class StreamSyncTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for x in range(5):
+            Product.objects.create(name="t{}".format(x), venue="store")
+        self.binding = JSONBinding(name="stream")
+
+    def testSplitPages(self):
+        items = [("1", b"aa"), ("2", b"bbbb"), ("3", b"c"), ("4", b"d" * 9)]
+        self.assertEqual(
+            [[key for key, raw in page] for page in split_pages(items, 5)],
+            [["1"], ["2", "3"], ["4"]])
+        self.assertEqual(
+            len(list(split_pages(items, 100, max_objects=3))), 2)
+
+    def testStream(self):
+        self.binding.object_cache.con.delete(
+            self.binding.object_cache.make_key("5"))
+        size = len(self.binding.object_cache.get_many_raw(["1"])["1"])
+
+        with mock.patch("binding.tasks.send_message") as send:
+            pages = stream_sync(self.binding, max_bytes=size * 2, workers=2)
+        self.assertEqual(pages, 2)
+        packets = [call[0][1] for call in send.call_args_list]
+        self.assertEqual(packets[-1], dict(action="sync", payload="ok", pages=2))
+        self.assertEqual(
+            sorted(packet["page"] for packet in packets[:-1]), [1, 2])
+        self.assertEqual(
+            sorted(o["name"] for packet in packets[:-1]
+                   for o in packet["payload"]),
+            ["t0", "t1", "t2", "t3"])
+
+        # the missing object was put back
+        self.assertEqual(self.binding.object_cache.get("5")["name"], "t4")
+
+    def testStreamPickled(self):
+        binding = TestBinding(name="stream-pickled")
+        objects = binding.all()
+        # pages are measured by the json sent, not the compressed pickles
+        key, instance = next(iter(objects.items()))
+        size = json_size(instance)
+        self.assertNotEqual(
+            size, len(binding.object_cache.get_many_raw([key])[key]))
+
+        with mock.patch("binding.tasks.send_message") as send:
+            pages = stream_sync(
+                binding, max_bytes=size * 2, workers=2, chunk_size=2)
+        self.assertEqual(pages, 3)
+        packets = [call[0][1] for call in send.call_args_list]
+        self.assertEqual(
+            sorted(o.name for packet in packets[:-1]
+                   for o in packet["payload"]),
+            ["t0", "t1", "t2", "t3", "t4"])
+
+
+class BatchedBinding(TestBinding):
+
+    def serialize_message(self, action, data):
+        return [data]
+
+
+class EventBatcherTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.binding = BatchedBinding(name="batched")
+        self.batcher = EventBatcher()
+
+    def add(self, key, action, data=None, group="g"):
+        self.batcher.add(
+            self.binding, key, action, data or key, group, window=10)
+
+    def testWindow(self):
+        self.add("1", "update")
+        self.add("2", "create")
+        self.add("1", "update")
+        self.add("2", "update", "2 updated")
+        self.add("3", "create")
+        self.add("3", "delete")
+        self.add("1", "update", group="other")
+
+        with mock.patch("binding.tasks.send_message") as send:
+            self.batcher.flush_all()
+        packets = dict((call[0][2], call[0][1]) for call in send.call_args_list)
+        # a created key is sent with its latest data
+        self.assertEqual(packets["g"], [
+            dict(action="update", payload=["1"]),
+            dict(action="create", payload=["2 updated"]),
+        ])
+        self.assertEqual(len(packets["other"]), 1)
+        self.assertEqual(self.batcher.pending, {})
+
+    def testSameName(self):
+        # bindings of different models may share a name
+        reviews = BatchedBinding(name="batched")
+        reviews.model = Review
+        reviews.bindings_key = "Review:batched"
+        self.add("1", "update")
+        self.batcher.add(reviews, "1", "delete", "1", "g", window=10)
+
+        with mock.patch("binding.tasks.send_message") as send:
+            self.batcher.flush_all()
+        packets = dict(
+            (call[0][0].bindings_key, call[0][1])
+            for call in send.call_args_list)
+        self.assertEqual(packets, {
+            "Product:batched": [dict(action="update", payload=["1"])],
+            "Review:batched": [dict(action="delete", payload=["1"])],
+        })
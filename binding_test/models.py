@@ -1,5 +1,7 @@
 from django.db import models
 
+from binding.query import BindingQuerySet
+
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
@@ -10,5 +12,14 @@ class Product(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = BindingQuerySet.as_manager()
+
     def __str__(self):
         return self.name
+
+
+class Review(models.Model):
+    product = models.ForeignKey(
+        Product, related_name="reviews", on_delete=models.CASCADE)
+    rating = models.IntegerField(null=True)
+    text = models.TextField(blank=True)